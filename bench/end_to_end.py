@@ -0,0 +1,176 @@
+"""End-to-end benchmark of check/in/out against an in-process fake S3 server.
+
+Builds a synthetic bucket (see bench/fake_s3.py), then times action_check, action_in
+and action_out in-process against it, with optional per-request latency. Besides wall
+time, each scenario records the requests and bytes the server saw on its last run.
+
+    python bench/end_to_end.py --keys 2000000 --large-size 5GiB --output e2e.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+
+from bench.fake_s3 import FakeBucket, FakeS3Server  # noqa: E402
+from src.action_check import action_check  # noqa: E402
+from src.action_in import action_in  # noqa: E402
+from src.action_out import action_out  # noqa: E402
+
+BUCKET = 'bench'
+SIZE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+
+def parse_size(value):
+    """'512', '64KiB', '8M', '5GiB' -> bytes"""
+    match = re.fullmatch(r'(\d+)\s*([kmg]?)(?:i?b)?', value.strip().lower())
+    if match is None:
+        raise argparse.ArgumentTypeError(f'not a size: {value!r}')
+    return int(match.group(1)) * SIZE_UNITS[match.group(2)]
+
+
+def release_key(number):
+    return f'releases/book-1.{number}.0.zip'
+
+
+def asset_key(number):
+    return f'assets/{number // 1000:04d}/page-{number:07d}.html'
+
+
+def source(endpoint, **extra):
+    return {
+        'service': {'bucket': BUCKET, 'endpoint': endpoint, 'region': 'us-east-1'},
+        'credentials': {'access_key_id': 'bench', 'secret_access_key': 'bench'},
+        **extra
+    }
+
+
+def scenarios(args, endpoint, work_dir):
+    """name -> run, where run gets a fresh, empty directory each time it is called"""
+    def check(**source_extra):
+        def run(run_dir):
+            input = {'source': source(endpoint, filters={'regexp': r'releases/book-(.*)\.zip'},
+                                      state_dir=str(run_dir / 'state'), **source_extra)}
+            return action_check(io.StringIO(json.dumps(input)))
+        return run
+
+    def download(params, version_key=None):
+        def run(run_dir):
+            input = {'source': source(endpoint, filters={'regexp': r'assets/.*', 'version': 'every'}),
+                     'version': {'key': version_key},
+                     'params': params}
+            return action_in(str(run_dir / 'dest'), io.StringIO(json.dumps(input)))
+        return run
+
+    def upload(glob):
+        def run(run_dir):
+            input = {'source': source(endpoint), 'params': {'glob': glob}}
+            return action_out(str(work_dir / 'upload'), io.StringIO(json.dumps(input)))
+        return run
+
+    return {
+        'check': check(),
+        'check_auto_shards': check(listing={'shards': 'auto'}),
+        'in_all': download({'mode': 'all'}),
+        'in_single': download({'mode': 'single'}, 'large/object.bin'),
+        'in_single_ranged': download({'mode': 'single', 'range_size': args.range_size}, 'large/object.bin'),
+        'out_small_files': upload('small/*'),
+        'out_large_file': upload('large/*'),
+    }
+
+
+def populate(bucket, args, work_dir):
+    bucket.add_synthetic((release_key(number) for number in range(args.keys)), args.object_size)
+    bucket.add_synthetic((asset_key(number) for number in range(args.objects)), args.object_size)
+    bucket.add_synthetic(['large/object.bin'], args.large_size)
+
+    small_dir = work_dir / 'upload' / 'small'
+    small_dir.mkdir(parents=True)
+    content = os.urandom(args.object_size)
+    for number in range(args.objects):
+        (small_dir / f'file-{number:07d}.bin').write_bytes(content)
+    large_dir = work_dir / 'upload' / 'large'
+    large_dir.mkdir()
+    with open(large_dir / 'object.bin', 'wb') as large_file:
+        # Sparse, so a multi-gigabyte upload costs no disk space
+        large_file.truncate(args.large_size)
+
+
+def time_scenario(bucket, run, repeat, work_dir):
+    timings = []
+    for attempt in range(repeat):
+        bucket.reset_counters()
+        with tempfile.TemporaryDirectory(dir=work_dir) as run_dir:
+            (Path(run_dir) / 'dest').mkdir()
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stderr(devnull):
+                start = time.perf_counter()
+                run(Path(run_dir))
+                timings.append(time.perf_counter() - start)
+    counters = bucket.counters()
+    transferred = counters['bytes_sent'] + counters['bytes_received']
+    return {
+        'median_seconds': statistics.median(timings),
+        'min_seconds': min(timings),
+        'max_seconds': max(timings),
+        'bytes_per_second': transferred / max(statistics.median(timings), 1e-9),
+        **counters,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, check=True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--keys', type=int, default=10000, help='release keys listed by check')
+    parser.add_argument('--objects', type=int, default=200, help='objects synced by in/out "all" runs')
+    parser.add_argument('--object-size', type=parse_size, default='1KiB')
+    parser.add_argument('--large-size', type=parse_size, default='64MiB')
+    parser.add_argument('--range-size', type=parse_size, default='8MiB')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='delay added to every request')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', action='append', help='run just this scenario (repeatable)')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    bucket = FakeBucket(BUCKET)
+    with tempfile.TemporaryDirectory() as work_dir, \
+            FakeS3Server(bucket, latency=args.latency_ms / 1000) as server:
+        work_dir = Path(work_dir)
+        populate(bucket, args, work_dir)
+        results = {
+            name: time_scenario(bucket, run, args.repeat, work_dir)
+            for name, run in scenarios(args, server.endpoint, work_dir).items()
+            if not args.only or name in args.only
+        }
+
+    report = {
+        'python': sys.version.split()[0],
+        'commit': git_commit(),
+        'config': {name: value for name, value in vars(args).items() if name not in ['output', 'only']},
+        'scenarios': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+    print(output)
+    return report
+
+
+if __name__ == '__main__':
+    main()
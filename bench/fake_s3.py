@@ -0,0 +1,470 @@
+"""An in-process, S3-compatible HTTP stand-in for benchmarks.
+
+Serves one bucket over path-style requests on 127.0.0.1, implementing the calls the
+resource makes: ListObjectsV2 (prefix, delimiter, start-after, continuation tokens),
+HEAD, ranged and conditional GET, PUT (plain or aws-chunked), and multipart uploads.
+
+Synthetic objects only record their size; their bytes are a repeating pattern produced
+on demand, so buckets of millions of keys and objects of many gigabytes cost no more
+than their key list. Uploaded bodies are hashed as they arrive and only kept when small.
+"""
+import bisect
+import collections
+import hashlib
+import socketserver
+import threading
+import time
+import uuid
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+from xml.sax.saxutils import escape
+
+PATTERN_BLOCK = bytes(range(256)) * 256
+MAX_KEPT_BYTES = 1024 * 1024
+DEFAULT_MAX_KEYS = 1000
+DEFAULT_READ_SIZE = 64 * 1024
+LAST_MODIFIED = 1700000000.0
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+XML_NAMESPACE = 'http://s3.amazonaws.com/doc/2006-03-01/'
+
+
+def pattern_chunks(start, end, chunk_size=len(PATTERN_BLOCK)):
+    """The synthetic bytes in [start, end), in chunks of at most chunk_size"""
+    position = start
+    while position < end:
+        offset = position % len(PATTERN_BLOCK)
+        chunk = PATTERN_BLOCK[offset:offset + min(chunk_size, end - position)]
+        yield chunk
+        position += len(chunk)
+
+
+def key_after(prefix):
+    """The smallest string sorting after every key that starts with prefix"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class LimitedReader:
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.remaining = length
+
+    def read(self, amt):
+        data = self.stream.read(min(amt, self.remaining))
+        self.remaining -= len(data)
+        return data
+
+    def readline(self):
+        line = self.stream.readline(self.remaining)
+        self.remaining -= len(line)
+        return line
+
+
+class ChunkedReader:
+    """Decodes both HTTP chunked transfer encoding and aws-chunked content encoding"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.remaining = 0
+        self.done = False
+
+    def read(self, amt):
+        if self.remaining == 0 and not self.done:
+            size = int(self.stream.readline().split(b';')[0].strip() or b'0', 16)
+            if size == 0:
+                self.done = True
+                while self.stream.readline().strip():
+                    pass
+            self.remaining = size
+        if self.done:
+            return b''
+        data = self.stream.read(min(amt, self.remaining))
+        self.remaining -= len(data)
+        if self.remaining == 0:
+            self.stream.readline()
+        return data
+
+    def readline(self):
+        line = bytearray()
+        while not line.endswith(b'\n'):
+            byte = self.read(1)
+            if not byte:
+                break
+            line.extend(byte)
+        return bytes(line)
+
+
+class StoredObject:
+    __slots__ = ('size', 'etag', 'data')
+
+    def __init__(self, size, etag, data=None):
+        self.size = size
+        self.etag = etag
+        self.data = data
+
+
+class FakeBucket:
+    def __init__(self, name):
+        self.name = name
+        self.keys = []
+        self.sizes = {}
+        self.stored = {}
+        self.uploads = {}
+        self.lock = threading.Lock()
+        self.requests = collections.Counter()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.throttled_requests = 0
+
+    def throttle(self, count):
+        """Answer the next `count` requests with 503 SlowDown"""
+        with self.lock:
+            self.throttled_requests += count
+
+    def take_throttle(self):
+        with self.lock:
+            if self.throttled_requests == 0:
+                return False
+            self.throttled_requests -= 1
+            self.requests['Throttled'] += 1
+            return True
+
+    def add_synthetic(self, keys, size):
+        """Add objects of the given size whose content is the repeating pattern"""
+        for key in keys:
+            self.sizes[key] = size
+        self.keys = sorted(set(self.keys).union(self.sizes))
+
+    def put(self, key, size, etag, data=None):
+        with self.lock:
+            if key not in self.sizes:
+                bisect.insort(self.keys, key)
+            self.sizes[key] = size
+            self.stored[key] = StoredObject(size, etag, data)
+
+    def etag(self, key):
+        stored = self.stored.get(key)
+        if stored is not None:
+            return stored.etag
+        return '"%s"' % hashlib.md5(key.encode()).hexdigest()
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests.clear()
+            self.bytes_sent = 0
+            self.bytes_received = 0
+
+    def counters(self):
+        with self.lock:
+            return {
+                'requests': dict(self.requests),
+                'bytes_sent': self.bytes_sent,
+                'bytes_received': self.bytes_received,
+            }
+
+    def count(self, operation, sent=0, received=0):
+        with self.lock:
+            self.requests[operation] += 1
+            self.bytes_sent += sent
+            self.bytes_received += received
+
+    def list_page(self, prefix, delimiter, start_after, token, max_keys):
+        """Returns (contents keys, common prefixes, next continuation token or None)"""
+        keys = self.keys
+        if token:
+            index = bisect.bisect_left(keys, bytes.fromhex(token).decode())
+        else:
+            index = bisect.bisect_left(keys, prefix)
+            if start_after:
+                index = max(index, bisect.bisect_right(keys, start_after))
+        contents = []
+        common_prefixes = []
+        while index < len(keys) and len(contents) + len(common_prefixes) < max_keys:
+            key = keys[index]
+            if not key.startswith(prefix):
+                return contents, common_prefixes, None
+            delimiter_at = key.find(delimiter, len(prefix)) if delimiter else -1
+            if delimiter_at == -1:
+                contents.append(key)
+                index += 1
+            else:
+                common_prefix = key[:delimiter_at + len(delimiter)]
+                common_prefixes.append(common_prefix)
+                index = bisect.bisect_left(keys, key_after(common_prefix))
+        if index < len(keys) and keys[index].startswith(prefix):
+            return contents, common_prefixes, keys[index].encode().hex()
+        return contents, common_prefixes, None
+
+
+class FakeS3Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeS3'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def bucket(self):
+        return self.server.bucket
+
+    def parse_target(self):
+        url = urlsplit(self.path)
+        bucket_name, _, key = url.path.lstrip('/').partition('/')
+        query = {name: values[0] for name, values in parse_qs(url.query, keep_blank_values=True).items()}
+        return bucket_name, unquote(key), query
+
+    def handle_request(self, method):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        bucket_name, key, query = self.parse_target()
+        if bucket_name != self.bucket.name:
+            return self.send_error_xml(404, 'NoSuchBucket', discard_body=True)
+        if self.bucket.take_throttle():
+            return self.send_error_xml(503, 'SlowDown', discard_body=True)
+        handler = {
+            'GET': self.get_bucket if not key else self.get_object,
+            'HEAD': self.head_object,
+            'PUT': self.upload_part if 'uploadId' in query else self.put_object,
+            'POST': self.create_multipart_upload if 'uploads' in query else self.complete_multipart_upload,
+            'DELETE': self.abort_multipart_upload,
+        }[method]
+        handler(key, query)
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_HEAD(self):
+        self.handle_request('HEAD')
+
+    def do_PUT(self):
+        self.handle_request('PUT')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def do_DELETE(self):
+        self.handle_request('DELETE')
+
+    def send_body(self, status, body, headers=(), content_type='application/xml'):
+        body = body.encode() if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+        return len(body)
+
+    def send_error_xml(self, status, code, discard_body=False):
+        if discard_body:
+            self.read_body(lambda chunk: None)
+        body = f'{XML_HEADER}<Error><Code>{code}</Code><Message>{code}</Message></Error>'
+        self.send_body(status, '' if self.command == 'HEAD' else body)
+
+    def body_stream(self):
+        stream = self.rfile
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            stream = ChunkedReader(stream)
+        else:
+            stream = LimitedReader(stream, int(self.headers.get('Content-Length', 0)))
+        if 'aws-chunked' in self.headers.get('Content-Encoding', ''):
+            stream = ChunkedReader(stream)
+        return stream
+
+    def read_body(self, consume):
+        stream = self.body_stream()
+        size = 0
+        while True:
+            chunk = stream.read(DEFAULT_READ_SIZE)
+            if not chunk:
+                return size
+            size += len(chunk)
+            consume(chunk)
+
+    def read_hashed_body(self):
+        """Returns (size, md5 digest, the bytes if small enough to keep)"""
+        digest = hashlib.md5()
+        kept = bytearray()
+
+        def consume(chunk):
+            digest.update(chunk)
+            if len(kept) <= MAX_KEPT_BYTES:
+                kept.extend(chunk)
+
+        size = self.read_body(consume)
+        return size, digest.digest(), bytes(kept) if size <= MAX_KEPT_BYTES else None
+
+    def get_bucket(self, key, query):
+        if query.get('list-type') != '2':
+            return self.send_error_xml(501, 'NotImplemented')
+        prefix = query.get('prefix', '')
+        delimiter = query.get('delimiter', '')
+        max_keys = int(query.get('max-keys', DEFAULT_MAX_KEYS))
+        contents, common_prefixes, next_token = self.bucket.list_page(
+            prefix, delimiter, query.get('start-after'), query.get('continuation-token'), max_keys)
+        last_modified = time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(LAST_MODIFIED))
+        parts = [XML_HEADER, f'<ListBucketResult xmlns="{XML_NAMESPACE}">',
+                 f'<Name>{escape(self.bucket.name)}</Name><Prefix>{escape(prefix)}</Prefix>',
+                 f'<KeyCount>{len(contents) + len(common_prefixes)}</KeyCount><MaxKeys>{max_keys}</MaxKeys>',
+                 f'<IsTruncated>{"true" if next_token else "false"}</IsTruncated>']
+        if delimiter:
+            parts.append(f'<Delimiter>{escape(delimiter)}</Delimiter>')
+        for object_key in contents:
+            parts.append(f'<Contents><Key>{escape(object_key)}</Key>'
+                         f'<LastModified>{last_modified}</LastModified>'
+                         f'<ETag>{escape(self.bucket.etag(object_key))}</ETag>'
+                         f'<Size>{self.bucket.sizes[object_key]}</Size>'
+                         '<StorageClass>STANDARD</StorageClass></Contents>')
+        for common_prefix in common_prefixes:
+            parts.append(f'<CommonPrefixes><Prefix>{escape(common_prefix)}</Prefix></CommonPrefixes>')
+        if next_token:
+            parts.append(f'<NextContinuationToken>{next_token}</NextContinuationToken>')
+        parts.append('</ListBucketResult>')
+        sent = self.send_body(200, ''.join(parts))
+        self.bucket.count('ListObjectsV2', sent=sent)
+
+    def object_headers(self, key):
+        return [('ETag', self.bucket.etag(key)),
+                ('Last-Modified', formatdate(LAST_MODIFIED, usegmt=True)),
+                ('Accept-Ranges', 'bytes')]
+
+    def precondition_status(self, key):
+        etag = self.bucket.etag(key)
+        if_match = self.headers.get('If-Match')
+        if if_match is not None and if_match != etag:
+            return 412
+        if self.headers.get('If-None-Match') == etag:
+            return 304
+        return None
+
+    def head_object(self, key, query):
+        if key not in self.bucket.sizes:
+            self.bucket.count('HeadObject')
+            return self.send_error_xml(404, 'NotFound')
+        self.send_response(200)
+        self.send_header('Content-Length', str(self.bucket.sizes[key]))
+        for name, value in self.object_headers(key):
+            self.send_header(name, value)
+        self.end_headers()
+        self.bucket.count('HeadObject')
+
+    def get_object(self, key, query):
+        if key not in self.bucket.sizes:
+            self.bucket.count('GetObject')
+            return self.send_error_xml(404, 'NoSuchKey')
+        status = self.precondition_status(key)
+        if status == 412:
+            self.bucket.count('GetObject')
+            return self.send_error_xml(412, 'PreconditionFailed')
+        if status == 304:
+            self.bucket.count('GetObject')
+            return self.send_body(304, b'', self.object_headers(key))
+        size = self.bucket.sizes[key]
+        start, end = 0, size
+        headers = self.object_headers(key)
+        range_header = self.headers.get('Range')
+        if range_header:
+            first, _, last = range_header.partition('=')[2].partition('-')
+            start, end = int(first), min(int(last) + 1 if last else size, size)
+            headers.append(('Content-Range', f'bytes {start}-{end - 1}/{size}'))
+        self.send_response(206 if range_header else 200)
+        self.send_header('Content-Length', str(end - start))
+        self.send_header('Content-Type', 'binary/octet-stream')
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        stored = self.bucket.stored.get(key)
+        if stored is not None and stored.data is not None:
+            self.wfile.write(stored.data[start:end])
+        else:
+            for chunk in pattern_chunks(start, end):
+                self.wfile.write(chunk)
+        self.bucket.count('GetObject', sent=end - start)
+
+    def put_object(self, key, query):
+        exists = key in self.bucket.sizes
+        if_match = self.headers.get('If-Match')
+        if ((self.headers.get('If-None-Match') == '*' and exists)
+                or (if_match is not None and (not exists or if_match != self.bucket.etag(key)))):
+            self.bucket.count('PutObject')
+            return self.send_error_xml(412, 'PreconditionFailed', discard_body=True)
+        size, digest, data = self.read_hashed_body()
+        etag = f'"{digest.hex()}"'
+        self.bucket.put(key, size, etag, data)
+        self.send_body(200, b'', [('ETag', etag)])
+        self.bucket.count('PutObject', received=size)
+
+    def create_multipart_upload(self, key, query):
+        self.read_body(lambda chunk: None)
+        upload_id = uuid.uuid4().hex
+        with self.bucket.lock:
+            self.bucket.uploads[upload_id] = {}
+        self.send_body(200, f'{XML_HEADER}<InitiateMultipartUploadResult xmlns="{XML_NAMESPACE}">'
+                            f'<Bucket>{escape(self.bucket.name)}</Bucket><Key>{escape(key)}</Key>'
+                            f'<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>')
+        self.bucket.count('CreateMultipartUpload')
+
+    def upload_part(self, key, query):
+        parts = self.bucket.uploads.get(query['uploadId'])
+        if parts is None:
+            return self.send_error_xml(404, 'NoSuchUpload', discard_body=True)
+        size, digest, data = self.read_hashed_body()
+        with self.bucket.lock:
+            parts[int(query['partNumber'])] = (size, digest, data)
+        self.send_body(200, b'', [('ETag', f'"{digest.hex()}"')])
+        self.bucket.count('UploadPart', received=size)
+
+    def complete_multipart_upload(self, key, query):
+        self.read_body(lambda chunk: None)
+        with self.bucket.lock:
+            parts = self.bucket.uploads.pop(query['uploadId'], None)
+        if parts is None:
+            return self.send_error_xml(404, 'NoSuchUpload')
+        ordered = [parts[number] for number in sorted(parts)]
+        size = sum(part_size for part_size, _, _ in ordered)
+        combined = hashlib.md5(b''.join(digest for _, digest, _ in ordered))
+        etag = f'"{combined.hexdigest()}-{len(ordered)}"'
+        data = None
+        if size <= MAX_KEPT_BYTES and all(part_data is not None for _, _, part_data in ordered):
+            data = b''.join(part_data for _, _, part_data in ordered)
+        self.bucket.put(key, size, etag, data)
+        self.send_body(200, f'{XML_HEADER}<CompleteMultipartUploadResult xmlns="{XML_NAMESPACE}">'
+                            f'<Bucket>{escape(self.bucket.name)}</Bucket><Key>{escape(key)}</Key>'
+                            f'<ETag>{escape(etag)}</ETag></CompleteMultipartUploadResult>')
+        self.bucket.count('CompleteMultipartUpload')
+
+    def abort_multipart_upload(self, key, query):
+        with self.bucket.lock:
+            self.bucket.uploads.pop(query.get('uploadId'), None)
+        self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+        self.bucket.count('AbortMultipartUpload')
+
+
+class FakeS3Server(socketserver.ThreadingMixIn, HTTPServer):
+    """Serves bucket on a free local port from a daemon thread while used as a context manager"""
+    daemon_threads = True
+
+    def __init__(self, bucket, latency=0.0):
+        super().__init__(('127.0.0.1', 0), FakeS3Handler)
+        self.bucket = bucket
+        self.latency = latency
+        self.thread = None
+
+    @property
+    def endpoint(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever, name='fake-s3', daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
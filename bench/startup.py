@@ -0,0 +1,74 @@
+"""Startup-time benchmark for the check/in/out entry points.
+
+Runs each console entry point as a fresh interpreter on an input that never
+needs the network and records wall time, plus whether boto3 got imported.
+
+    python bench/startup.py --repeat 20 --output startup.json
+"""
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+def entry_points(work_dir):
+    return {
+        'interpreter': (['-c', 'pass'], {}),
+        'check': (['-m', 'src.action_check'], {}),
+        'in': (['-m', 'src.action_in', str(work_dir)], {'params': {}}),
+        'out': (['-m', 'src.action_out', str(work_dir)], {'params': {'glob': 'nothing-*.txt'}}),
+    }
+
+
+def run(args, input, *extra_flags):
+    return subprocess.run([sys.executable, *extra_flags, *args],
+                          input=json.dumps(input).encode(),
+                          cwd=REPO_DIR,
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE,
+                          check=True)
+
+
+def time_entry_point(args, input, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(args, input)
+        timings.append(time.perf_counter() - start)
+    import_log = run(args, input, '-X', 'importtime').stderr.decode()
+    return {
+        'median_seconds': statistics.median(timings),
+        'min_seconds': min(timings),
+        'max_seconds': max(timings),
+        'imports_boto3': re.search(r'\|\s+boto3$', import_log, re.MULTILINE) is not None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        results = {
+            name: time_entry_point(entry_args, input, args.repeat)
+            for name, (entry_args, input) in entry_points(work_dir).items()
+        }
+
+    report = {'python': sys.version.split()[0], 'repeat': args.repeat, 'entry_points': results}
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
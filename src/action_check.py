@@ -1,6 +1,7 @@
 import json
 import sys
 
+from .profiling import profiled
 from .resource_boto_client import ResourceBotoClient
 from .utils import eprint
 
@@ -8,15 +9,15 @@ from .utils import eprint
 def action_check(in_stream):
     input = json.load(in_stream)
     client = ResourceBotoClient(input)
-    object_keys = client.list_filtered_objects()
-    eprint('Versions found: ' + str(object_keys))
+    with profiled('check', input), client.metrics.reported('check'):
+        object_keys = client.list_filtered_objects(incremental=True)
+    if object_keys:
+        eprint(f'Versions found: {len(object_keys)}, latest: {object_keys[-1]["key"]}')
     return object_keys
 
 
 def main():  # pragma: no cover
-    output = json.dumps(action_check(sys.stdin))
-    eprint('Output: ' + output)
-    print(output)
+    print(json.dumps(action_check(sys.stdin)))
 
 
 if __name__ == '__main__':  # pragma: no cover
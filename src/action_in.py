@@ -2,7 +2,9 @@ import json
 import sys
 from pathlib import Path
 
+from .profiling import profiled
 from .resource_boto_client import ResourceBotoClient
+from .sync_manifest import scan_files, manifest_entry, load_manifest, save_manifest
 from .utils import eprint
 
 
@@ -18,32 +20,74 @@ def action_in(dest_path, in_stream):
     def download_check_version():
         destination = Path(dest_path) / check_version
         eprint(f'Downloading object - key: {check_version}, dest: {destination}')
-        client.download_file(
-            key=check_version,
-            destination=destination)
+        if client.range_size is not None:
+            client.download_file_ranged(
+                key=check_version,
+                destination=destination)
+        else:
+            client.download_file(
+                key=check_version,
+                destination=destination)
         eprint('Object downloaded: ' + check_version)
         return {'version': {'key': check_version}}
 
+    def extract_check_version():
+        eprint(f'Extracting archive - key: {check_version}, dest: {dest_path}')
+        extracted_count = client.download_archive(key=check_version, dest_path=dest_path)
+        eprint(f'Archive extracted: {check_version}, {extracted_count} member(s)')
+        return {'version': {'key': check_version}}
+
     def sync_filtered():
-        object_key_dicts = client.list_filtered_objects()
-        object_key = None
-        for object_key_dict in object_key_dicts:
-            object_key = object_key_dict['key']
-            destination = Path(dest_path) / object_key
-            if not destination.exists():
+        present_files = scan_files(dest_path)
+        manifest_path = Path(dest_path) / client.manifest if client.manifest else None
+        manifest = load_manifest(manifest_path) if manifest_path else None
+        listed_entries = {}
+        latest_record = None
+
+        def pending_downloads():
+            nonlocal latest_record
+            # Records stream in listing order as the listing runs, so downloads start
+            # with the first matched page rather than after the whole listing
+            for record in client.iter_filtered_objects():
+                if latest_record is None or record.sort_key() >= latest_record.sort_key():
+                    latest_record = record
+                object_key = record.key
+                if manifest is not None:
+                    listed_entries[object_key] = manifest_entry(record)
+                if object_key in present_files and (
+                        manifest is None or manifest.get(object_key) == listed_entries[object_key]):
+                    continue
+                destination = Path(dest_path) / object_key
                 eprint(f'Downloading object - key: {object_key}, dest: {destination}')
-                client.download_file(
-                    key=object_key,
-                    destination=destination)
+                yield object_key, destination
+
+        failed_keys = []
+        for downloaded_key, error in client.download_files(pending_downloads()):
+            if error is None:
+                eprint('Object downloaded: ' + downloaded_key)
+                if manifest is not None:
+                    manifest[downloaded_key] = listed_entries[downloaded_key]
+            else:
+                eprint(f'Failed to download object - key: {downloaded_key}, error: {error!r}')
+                failed_keys.append(downloaded_key)
+        if manifest is not None:
+            save_manifest(manifest_path, manifest)
+        if failed_keys:
+            raise RuntimeError(f'Failed to download {len(failed_keys)} object(s): {failed_keys}')
 
         # This is a garbage value
-        return {'version': {'key': object_key}} if object_key is not None else {}
+        return {'version': {'key': latest_record.key}} if latest_record is not None else {}
 
-    return {
-        'all': sync_filtered,
-        'single': download_check_version,
-        None: lambda: {}
-    }[action_mode]()
+    with profiled('in', input), client.metrics.reported('in'):
+        result = {
+            'all': sync_filtered,
+            'single': download_check_version,
+            'archive': extract_check_version,
+            None: lambda: {}
+        }[action_mode]()
+    if result:
+        result['metadata'] = client.governor.metadata()
+    return result
 
 
 def main():  # pragma: no cover
@@ -2,26 +2,63 @@ import json
 import sys
 from pathlib import Path
 
+from .profiling import profiled
 from .resource_boto_client import ResourceBotoClient
-from .utils import eprint
+from .utils import eprint, glob_literal_prefix
 
 
 def action_out(src_path, in_stream):
     input = json.load(in_stream)
     client = ResourceBotoClient(input)
+    with profiled('out', input), client.metrics.reported('out'):
+        result = upload_glob_matches(client, src_path)
+    if result:
+        result['metadata'] = client.governor.metadata()
+    return result
 
+
+def upload_glob_matches(client, src_path):
     eprint(f'source path: {Path(src_path)}')
     eprint(f'upload glob: {client.upload_glob}')
-    eprint(f'glob matches: {list(Path(src_path).glob(client.upload_glob))}')
-    object_paths = list(filter(Path.is_file, Path(src_path).glob(client.upload_glob)))
     object_key = None
-    for object_path in object_paths:
-        object_file = str(object_path)
-        object_key = str(object_path)[len(src_path)+1:]
-        client.upload_file(
-            source=object_file,
-            key=object_key)
-    eprint('Uploaded objects: ' + str(object_paths))
+
+    def pending_uploads():
+        nonlocal object_key
+        for object_path in Path(src_path).glob(client.upload_glob):
+            if object_path.is_file():
+                object_key = str(object_path)[len(src_path)+1:]
+                yield str(object_path), object_key
+
+    if client.archive_key is not None:
+        eprint(f'Archiving to: {client.archive_key}, compression: {client.compression}')
+        archived_count = client.upload_archive(pending_uploads())
+        eprint(f'Uploaded archive of {archived_count} file(s): {client.archive_key}')
+        if client.index_key is not None:
+            client.update_index([client.archive_key])
+        return {'version': {'key': client.archive_key}}
+
+    uploads = pending_uploads()
+    if client.skip_unchanged:
+        remote_prefix = glob_literal_prefix(client.upload_glob)
+        remote_objects = client.remote_objects(remote_prefix)
+        eprint(f'Comparing against {len(remote_objects)} remote object(s) under: {remote_prefix!r}')
+        uploads = client.iter_changed_uploads(uploads, remote_objects)
+
+    uploaded_keys = []
+    failed_keys = []
+    for uploaded_key, error in client.upload_files(uploads):
+        if error is None:
+            eprint('Uploaded object: ' + uploaded_key)
+            uploaded_keys.append(uploaded_key)
+        else:
+            eprint(f'Failed to upload object - key: {uploaded_key}, error: {error!r}')
+            failed_keys.append(uploaded_key)
+    eprint(f'Uploaded {len(uploaded_keys)} object(s)')
+    if failed_keys:
+        raise RuntimeError(f'Failed to upload {len(failed_keys)} object(s): {failed_keys}')
+    if client.index_key is not None:
+        indexed_count = client.update_index(uploaded_keys)
+        eprint(f'Index object updated: {client.index_key}, {indexed_count} version(s) added')
     # This is a garbage value
     return {'version': {'key': object_key}} if object_key is not None else {}
 
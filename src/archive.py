@@ -0,0 +1,121 @@
+import os
+import threading
+
+COMPRESSIONS = [None, 'gzip', 'bz2', 'xz', 'zstd']
+TARFILE_COMPRESSIONS = {None: '', 'gzip': 'gz', 'bz2': 'bz2', 'xz': 'xz', 'zstd': ''}
+
+
+def import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError('params.compression: zstd requires the optional zstandard package')
+    return zstandard
+
+
+class ArchivePipeReader:
+    """Read end of the pipe the archive is written into. If the writer fails, reading
+    raises instead of returning EOF, so a truncated archive is never uploaded."""
+
+    def __init__(self, fd):
+        self.file = os.fdopen(fd, 'rb')
+        self.writer_error = None
+
+    def read(self, amt=-1):
+        data = self.file.read(amt)
+        if not data and self.writer_error is not None:
+            raise IOError(f'Archive could not be written: {self.writer_error!r}')
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def write_archive(fileobj, members, compression):
+    """Stream a tar of (path, name) members into fileobj"""
+    import tarfile
+
+    if compression == 'zstd':
+        compressor = import_zstandard().ZstdCompressor().stream_writer(fileobj, closefd=False)
+        with compressor, tarfile.open(fileobj=compressor, mode='w|') as archive:
+            for path, name in members:
+                archive.add(path, arcname=name)
+        return
+    with tarfile.open(fileobj=fileobj, mode='w|' + TARFILE_COMPRESSIONS[compression]) as archive:
+        for path, name in members:
+            archive.add(path, arcname=name)
+
+
+def upload_archive(upload_fileobj, members, compression):
+    """Tar members into a pipe that upload_fileobj consumes as it is written, so the
+    archive is uploaded (as a multipart upload, once large enough) without ever being
+    staged on disk. Returns the number of members archived."""
+    if compression == 'zstd':
+        import_zstandard()
+    read_fd, write_fd = os.pipe()
+    reader = ArchivePipeReader(read_fd)
+    upload_errors = []
+
+    def upload():
+        try:
+            upload_fileobj(reader)
+        except BaseException as error:
+            upload_errors.append(error)
+        finally:
+            # Unblocks the writer with BrokenPipeError if the upload stopped early
+            reader.close()
+
+    uploader = threading.Thread(target=upload, name='archive-upload')
+    uploader.start()
+    count = 0
+
+    def counted(members):
+        nonlocal count
+        for member in members:
+            count += 1
+            yield member
+
+    writer = os.fdopen(write_fd, 'wb')
+    try:
+        write_archive(writer, counted(members), compression)
+    except BrokenPipeError:
+        pass
+    except BaseException as error:
+        # Set before the write end closes so the reader never mistakes it for EOF
+        reader.writer_error = error
+        raise
+    finally:
+        try:
+            writer.close()
+        except BrokenPipeError:
+            pass
+        uploader.join()
+    if upload_errors:
+        raise upload_errors[0]
+    return count
+
+
+def unsafe_member(member):
+    name = member.name
+    return (os.path.isabs(name) or '..' in name.split('/')
+            or not (member.isfile() or member.isdir()))
+
+
+def extract_archive(stream, dest_path, compression):
+    """Extract a tar read sequentially from stream, without staging it locally"""
+    import tarfile
+
+    if compression == 'zstd':
+        stream = import_zstandard().ZstdDecompressor().stream_reader(stream)
+    mode = 'r|*' if compression is None else 'r|' + TARFILE_COMPRESSIONS[compression]
+    count = 0
+    with tarfile.open(fileobj=stream, mode=mode) as archive:
+        for member in archive:
+            if hasattr(tarfile, 'data_filter'):
+                archive.extract(member, dest_path, filter='data')
+            elif unsafe_member(member):  # pragma: no cover - Python without tarfile filters
+                raise ValueError(f'Refusing to extract unsafe archive member: {member.name}')
+            else:  # pragma: no cover
+                archive.extract(member, dest_path)
+            count += 1
+    return count
@@ -0,0 +1,114 @@
+import base64
+import hashlib
+
+from .utils import READ_CHUNK_SIZE, eprint
+
+ALGORITHMS = [None, 'md5', 'sha256', 'crc32c']
+S3_CHECKSUM_ALGORITHMS = {'sha256': 'SHA256', 'crc32c': 'CRC32C'}
+S3_CHECKSUM_FIELDS = {'sha256': 'ChecksumSHA256', 'crc32c': 'ChecksumCRC32C'}
+# s3transfer clamps part sizes into this range
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PART_SIZE = 5 * 1024 * 1024 * 1024
+
+
+class IntegrityError(RuntimeError):
+    pass
+
+
+def new_hasher(algorithm):
+    if algorithm == 'crc32c':
+        try:
+            import crc32c
+        except ImportError:
+            raise ValueError('params.verify: crc32c requires the optional crc32c package')
+        return crc32c.CRC32CHash()
+    return hashlib.new(algorithm)
+
+
+class StreamDigest:
+    """Checksums of a byte stream; for md5, also its S3 ETag when the part layout is given"""
+
+    def __init__(self, algorithm, part_size=None, multipart_threshold=None):
+        self.algorithm = algorithm
+        self.hasher = new_hasher(algorithm)
+        self.size = 0
+        self.multipart_threshold = multipart_threshold
+        self.part_size = None if part_size is None else min(max(part_size, MIN_PART_SIZE), MAX_PART_SIZE)
+        self.part_digests = []
+        self.part_hasher = hashlib.md5()
+        self.part_filled = 0
+
+    def update(self, data):
+        self.hasher.update(data)
+        self.size += len(data)
+        if self.algorithm != 'md5' or self.part_size is None:
+            return
+        view = memoryview(data)
+        while view:
+            take = min(len(view), self.part_size - self.part_filled)
+            self.part_hasher.update(view[:take])
+            self.part_filled += take
+            view = view[take:]
+            if self.part_filled == self.part_size:
+                self.part_digests.append(self.part_hasher.digest())
+                self.part_hasher = hashlib.md5()
+                self.part_filled = 0
+
+    def s3_checksum(self):
+        return base64.b64encode(self.hasher.digest()).decode()
+
+    def etag(self):
+        if self.part_size is None or self.size < self.multipart_threshold:
+            return f'"{self.hasher.hexdigest()}"'
+        part_digests = self.part_digests + ([self.part_hasher.digest()] if self.part_filled else [])
+        return f'"{hashlib.md5(b"".join(part_digests)).hexdigest()}-{len(part_digests)}"'
+
+
+def file_etag(path, part_size=None):
+    """The ETag S3 gives path when uploaded in one part, or in `part_size` parts"""
+    digest = StreamDigest('md5', part_size=part_size, multipart_threshold=None if part_size is None else 0)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.etag()
+
+
+class HashingReader:
+    """Read-only, non-seekable file wrapper feeding every byte read into a StreamDigest.
+    Being non-seekable makes s3transfer read the file once, in order."""
+
+    def __init__(self, fileobj, digest):
+        self.fileobj = fileobj
+        self.digest = digest
+
+    def read(self, amt=-1):
+        data = self.fileobj.read(amt)
+        self.digest.update(data)
+        return data
+
+
+def verify_digest(key, digest, response):
+    """Compare a streamed digest with the ETag or checksum S3 reported for the object.
+    Raises IntegrityError on mismatch; returns False if nothing comparable was reported."""
+    if digest.algorithm == 'md5':
+        expected = response.get('ETag')
+        if expected is None or ('-' in expected and digest.part_size is None):
+            expected = None
+        elif response.get('ServerSideEncryption') == 'aws:kms' or response.get('SSECustomerAlgorithm'):
+            # The ETag of an SSE-KMS or SSE-C object is not the MD5 of its data
+            expected = None
+        actual = digest.etag()
+    else:
+        expected = response.get(S3_CHECKSUM_FIELDS[digest.algorithm])
+        if expected is not None and '-' in expected:
+            # A composite checksum of the parts, not of the whole object
+            expected = None
+        actual = digest.s3_checksum()
+
+    if expected is None:
+        eprint(f'Cannot verify {digest.algorithm} of {key} - no comparable checksum from S3')
+        return False
+    if expected != actual:
+        raise IntegrityError(f'Integrity check failed for {key}: S3 reports {digest.algorithm} '
+                             f'{expected}, transferred bytes give {actual}')
+    return True
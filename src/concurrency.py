@@ -0,0 +1,89 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from .metrics import is_throttle
+
+THROTTLE_BACKOFF = 0.5
+LATENCY_TOLERANCE = 4.0
+LATENCY_SMOOTHING = 0.2
+MIN_BACKOFF_INTERVAL = 0.05
+
+
+class ConcurrencyGovernor:
+    """AIMD limit on in-flight S3 work, shared by listing, downloads and uploads"""
+
+    def __init__(self, max_limit, min_limit=1):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(max_limit)
+        self.lowest_limit = max_limit
+        self.in_flight = 0
+        self.throttles = 0
+        self.latencies = {}
+        self.last_backoff = None
+        self.condition = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.in_flight -= 1
+                self.condition.notify()
+
+    def instrument(self, client):
+        """Feed a boto3 client's call latencies and throttled responses into the limit"""
+        events = client.meta.events
+        events.register('before-call.s3', self.before_call)
+        events.register('response-received.s3', self.response_received)
+        events.register('after-call.s3', self.after_call)
+
+    def before_call(self, context, **kwargs):
+        context['governor_started'] = time.perf_counter()
+
+    def response_received(self, response_dict, parsed_response, **kwargs):
+        if is_throttle(response_dict, parsed_response):
+            self.back_off()
+
+    def after_call(self, http_response, model, context, **kwargs):
+        started = context.pop('governor_started', None)
+        if started is None or http_response.status_code >= 300:
+            return
+        self.record_success(model.name, time.perf_counter() - started)
+
+    def record_success(self, operation, latency):
+        with self.condition:
+            average = self.latencies.get(operation)
+            self.latencies[operation] = latency if average is None else (
+                average + LATENCY_SMOOTHING * (latency - average))
+            if average is not None and latency > LATENCY_TOLERANCE * average:
+                return
+            if self.limit < self.max_limit:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                self.condition.notify_all()
+
+    def back_off(self):
+        with self.condition:
+            self.throttles += 1
+            now = time.perf_counter()
+            round_trip = max(MIN_BACKOFF_INTERVAL, max(self.latencies.values(), default=0.0))
+            if self.last_backoff is not None and now - self.last_backoff < round_trip:
+                return
+            self.last_backoff = now
+            self.limit = max(self.min_limit, self.limit * THROTTLE_BACKOFF)
+            self.lowest_limit = min(self.lowest_limit, int(self.limit))
+
+    def metadata(self):
+        """Concourse output metadata describing how the limit behaved"""
+        with self.condition:
+            return [
+                {'name': 'concurrency_limit', 'value': str(int(self.limit))},
+                {'name': 'concurrency_lowest_limit', 'value': str(self.lowest_limit)},
+                {'name': 'throttles', 'value': str(self.throttles)},
+            ]
@@ -0,0 +1,46 @@
+import json
+
+from .utils import last_modified_timestamp
+
+INDEX_FORMAT_VERSION = 1
+
+
+def empty_index():
+    return {'format': INDEX_FORMAT_VERSION, 'objects': []}
+
+
+def index_entry(response_object, version):
+    return {
+        'key': response_object['Key'],
+        'version': list(version),
+        'etag': response_object.get('ETag'),
+        'size': response_object.get('Size'),
+        'mtime': last_modified_timestamp(response_object.get('LastModified'))
+    }
+
+
+def response_object_from_index_entry(entry):
+    return {
+        'Key': entry['key'],
+        'LastModified': entry['mtime'],
+        'Size': entry['size'],
+        'ETag': entry['etag']
+    }
+
+
+def merge_index(document, entries):
+    """A copy of the index document with entries added, replacing any with the same key"""
+    objects = {entry['key']: entry for entry in document.get('objects', [])}
+    objects.update((entry['key'], entry) for entry in entries)
+    return {'format': INDEX_FORMAT_VERSION, 'objects': [objects[key] for key in sorted(objects)]}
+
+
+def parse_index(body):
+    document = json.loads(body)
+    if not isinstance(document, dict) or not isinstance(document.get('objects'), list):
+        raise ValueError('Index object is not a valid index document')
+    return document
+
+
+def serialize_index(document):
+    return json.dumps(document, separators=(',', ':')).encode()
@@ -0,0 +1,64 @@
+import json
+import os
+import time
+from pathlib import Path
+
+from .state import read_state, state_path, write_text_atomically
+from .utils import last_modified_timestamp
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def cache_entry(response_object):
+    return [response_object['Key'],
+            last_modified_timestamp(response_object.get('LastModified')),
+            response_object.get('Size'),
+            response_object.get('ETag')]
+
+
+def response_object_from_entry(entry):
+    key, last_modified, size, etag = entry
+    return {'Key': key, 'LastModified': last_modified, 'Size': size, 'ETag': etag}
+
+
+class ListingCache:
+    """On-disk copy of one prefix listing, trusted for `ttl` seconds after the full
+    listing it came from. Cache files in the directory are evicted oldest-used first
+    once they exceed `max_bytes` together."""
+
+    def __init__(self, state_dir, ttl, max_bytes, *identity):
+        self.path = state_path(state_dir, 'listing', *identity)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    def load(self):
+        """(listed_at, last_key, entries) of a fresh cached listing, or None"""
+        cached = read_state(self.path)
+        if not cached or time.time() - cached['listed_at'] > self.ttl:
+            return None
+        os.utime(self.path)
+        return cached['listed_at'], cached['last_key'], cached['entries']
+
+    def store(self, listed_at, last_key, entries):
+        text = json.dumps({'listed_at': listed_at, 'last_key': last_key, 'entries': entries})
+        if len(text) > self.max_bytes:
+            return False
+        write_text_atomically(self.path, text)
+        self.evict()
+        return True
+
+    def evict(self):
+        cache_files = []
+        for path in Path(self.path).parent.glob('listing-*.json'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            cache_files.append((stat.st_mtime, stat.st_size, path))
+        total_bytes = sum(size for _, size, _ in cache_files)
+        for _, size, path in sorted(cache_files):
+            if total_bytes <= self.max_bytes:
+                break
+            if path != self.path:
+                path.unlink()
+                total_bytes -= size
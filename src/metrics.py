@@ -0,0 +1,159 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from .utils import eprint
+
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+THROTTLE_ERROR_CODES = ['SlowDown', 'Throttling', 'ThrottlingException', 'ThrottledException',
+                        'RequestThrottled', 'RequestLimitExceeded', 'TooManyRequests',
+                        'TooManyRequestsException']
+THROTTLE_STATUS_CODES = [429, 503]
+
+
+def is_throttle(response_dict, parsed_response):
+    if response_dict is not None and response_dict.get('status_code') in THROTTLE_STATUS_CODES:
+        return True
+    error = (parsed_response or {}).get('Error', {})
+    return error.get('Code') in THROTTLE_ERROR_CODES
+
+
+class Metrics:
+    """Per-operation timings and byte counts for one action, summarized as one JSON object"""
+
+    def __init__(self, output_file=None):
+        self.output_file = output_file
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.operations = {}
+        self.phases = {}
+
+    def operation(self, name):
+        return self.operations.setdefault(name, {
+            'calls': 0, 'seconds': 0.0, 'bytes': 0, 'retries': 0, 'throttles': 0, 'errors': 0})
+
+    def add_phase(self, name, seconds, bytes=0):
+        with self.lock:
+            phase = self.phases.setdefault(name, {'count': 0, 'seconds': 0.0, 'bytes': 0})
+            phase['count'] += 1
+            phase['seconds'] += seconds
+            phase['bytes'] += bytes
+
+    @contextmanager
+    def phase(self, name):
+        """Time the block as one occurrence of phase `name`. The block may set
+        `bytes` on the yielded dict to attribute a payload size to it."""
+        span = {'bytes': 0}
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            self.add_phase(name, time.perf_counter() - start, span['bytes'])
+
+    def timed_iter(self, iterable, producer, consumer=None):
+        """Yield from iterable, timing the work of producing each item as phase `producer`
+        and, if named, the caller's work between items as phase `consumer`"""
+        produced = consumed = 0.0
+        iterator = iter(iterable)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    produced += time.perf_counter() - start
+                start = time.perf_counter()
+                yield item
+                consumed += time.perf_counter() - start
+        finally:
+            self.add_phase(producer, produced)
+            if consumer is not None:
+                self.add_phase(consumer, consumed)
+
+    def instrument(self, client):
+        """Hook timing, byte, retry and throttle accounting onto a boto3 client's events"""
+        events = client.meta.events
+        events.register('before-call.s3', self.before_call)
+        events.register('before-send.s3', self.before_send)
+        events.register('response-received.s3', self.response_received)
+        events.register('after-call.s3', self.after_call)
+        events.register('after-call-error.s3', self.after_call_error)
+
+    def before_call(self, model, context, **kwargs):
+        context['metrics_operation'] = model.name
+        context['metrics_started'] = time.perf_counter()
+
+    def before_send(self, request, event_name, **kwargs):
+        sent = int(request.headers.get('Content-Length') or 0) if request.method in ['PUT', 'POST'] else 0
+        if sent:
+            with self.lock:
+                self.operation(event_name.rsplit('.', 1)[-1])['bytes'] += sent
+
+    def response_received(self, response_dict, parsed_response, context, **kwargs):
+        if is_throttle(response_dict, parsed_response):
+            with self.lock:
+                self.operation(context.get('metrics_operation', 'unknown'))['throttles'] += 1
+
+    def finish_call(self, context, *, received=0, retries=0, failed=False):
+        if 'metrics_started' not in context:
+            return
+        seconds = time.perf_counter() - context.pop('metrics_started')
+        with self.lock:
+            operation = self.operation(context['metrics_operation'])
+            operation['calls'] += 1
+            operation['seconds'] += seconds
+            operation['bytes'] += received
+            operation['retries'] += retries
+            operation['errors'] += failed
+
+    def after_call(self, http_response, parsed, model, context, **kwargs):
+        received = parsed.get('ContentLength', 0) if model.name == 'GetObject' else 0
+        self.finish_call(context,
+                         received=received or 0,
+                         retries=parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0),
+                         failed=http_response.status_code >= 300)
+
+    def after_call_error(self, context, **kwargs):
+        self.finish_call(context, failed=True)
+
+    def summary(self, action):
+        with self.lock:
+            operations = {name: dict(values) for name, values in sorted(self.operations.items())}
+            phases = {name: dict(values) for name, values in sorted(self.phases.items())}
+        return {
+            'action': action,
+            'seconds': time.perf_counter() - self.started,
+            'operations': operations,
+            'phases': phases,
+            'retries': sum(operation['retries'] for operation in operations.values()),
+            'throttles': sum(operation['throttles'] for operation in operations.values()),
+        }
+
+    def emit(self, action):
+        """Write the summary as one line of JSON to output_file, or to stderr"""
+        output = json.dumps({'metrics': self.summary(action)})
+        if self.output_file is None:
+            eprint(output)
+        else:
+            Path(self.output_file).parent.mkdir(parents=True, exist_ok=True)
+            Path(self.output_file).write_text(output + '\n')
+
+    @contextmanager
+    def reported(self, action):
+        """Emit the summary when the block exits, whether or not it succeeded"""
+        try:
+            yield self
+        finally:
+            self.emit(action)
@@ -0,0 +1,97 @@
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from .state import default_state_dir
+from .utils import deep_get, eprint, null_context
+
+PROFILE_KINDS = ['cpu', 'memory']
+PROFILE_ENV = 'S3_RESOURCE_PROFILE'
+PROFILE_DIR_ENV = 'S3_RESOURCE_PROFILE_DIR'
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+
+
+def parse_profile_kinds(value, option_name):
+    """'cpu,memory' or ['cpu', 'memory'] -> ['cpu', 'memory']; nothing set -> []"""
+    if not value:
+        return []
+    kinds = value.split(',') if isinstance(value, str) else value
+    kinds = [kind.strip() for kind in kinds]
+    unknown = [kind for kind in kinds if kind not in PROFILE_KINDS]
+    if unknown:
+        raise ValueError(f'{option_name} must only name {PROFILE_KINDS}, got {unknown}')
+    return kinds
+
+
+def profile_kinds(input):
+    """The environment wins over source.profile, so a running pipeline can be profiled
+    without touching its configuration"""
+    if os.environ.get(PROFILE_ENV):
+        return parse_profile_kinds(os.environ[PROFILE_ENV], PROFILE_ENV)
+    return parse_profile_kinds(deep_get(input, 'source', 'profile', 'kinds'), 'source.profile.kinds')
+
+
+def profile_dir(input):
+    return Path(os.environ.get(PROFILE_DIR_ENV)
+                or deep_get(input, 'source', 'profile', 'dir')
+                or default_state_dir() / 'profiles')
+
+
+def profiled(action, input):
+    """Context manager profiling the block when asked to, otherwise a no-op that
+    imports, starts and resolves nothing"""
+    kinds = profile_kinds(input)
+    if not kinds:
+        return null_context()
+    return profiling(action, kinds, profile_dir(input))
+
+
+@contextmanager
+def profiling(action, kinds, profile_dir):
+    profile_dir.mkdir(parents=True, exist_ok=True)
+    report_prefix = profile_dir / f'{action}-{time.strftime("%Y%m%dT%H%M%S")}-{os.getpid()}'
+    profiler = None
+    if 'memory' in kinds:
+        import tracemalloc
+        tracemalloc.start()
+    if 'cpu' in kinds:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            write_cpu_reports(profiler, report_prefix)
+        if 'memory' in kinds:
+            write_memory_report(report_prefix)
+
+
+def write_cpu_reports(profiler, report_prefix):
+    """A .pstats dump for pstats/snakeviz, plus the top functions by cumulative time as text"""
+    import pstats
+
+    stats_path = report_prefix.with_name(report_prefix.name + '.pstats')
+    profiler.dump_stats(stats_path)
+    with open(report_prefix.with_name(report_prefix.name + '-cpu.txt'), 'w') as f:
+        stats = pstats.Stats(profiler, stream=f)
+        stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+    eprint(f'CPU profile written: {stats_path}')
+
+
+def write_memory_report(report_prefix):
+    import tracemalloc
+
+    snapshot = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    report_path = report_prefix.with_name(report_prefix.name + '-memory.txt')
+    with open(report_path, 'w') as f:
+        f.write(f'current: {current} bytes, peak: {peak} bytes\n')
+        f.write(f'top {TOP_ALLOCATIONS} allocation sites by size:\n')
+        for statistic in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+            f.write(f'{statistic}\n')
+    eprint(f'Memory profile written: {report_path}')
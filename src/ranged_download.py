@@ -0,0 +1,82 @@
+import os
+import threading
+from contextlib import closing
+
+from .state import read_state, write_state
+from .utils import READ_CHUNK_SIZE, eprint, map_concurrently, null_context
+
+
+def byte_ranges(size, range_size):
+    """Inclusive (start, end) byte ranges covering an object of `size` bytes"""
+    return [(start, min(start + range_size, size) - 1) for start in range(0, size, range_size)]
+
+
+def preallocate(fd, size):
+    """Size the file up front and reserve its blocks where the filesystem allows"""
+    os.ftruncate(fd, size)
+    if size and hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except OSError:
+            pass
+
+
+def fetch_range_into(client, fd, *, bucket, key, etag, byte_range):
+    """GET one byte range and write it at its offset in fd as it streams in"""
+    start, end = byte_range
+    response = client.get_object(Bucket=bucket, Key=key, Range=f'bytes={start}-{end}', IfMatch=etag)
+    offset = start
+    with closing(response['Body']) as body:
+        for chunk in body.iter_chunks(READ_CHUNK_SIZE):
+            offset += os.pwrite(fd, chunk, offset)
+    if offset != end + 1:
+        raise IOError(f'Short read for {key} bytes {start}-{end}: got {offset - start} bytes')
+
+
+def part_paths(destination):
+    return (destination.with_name(destination.name + '.part'),
+            destination.with_name(destination.name + '.part.json'))
+
+
+def download_ranged(client, *, bucket, key, destination, range_size, concurrency, slot=null_context):
+    """Fetch byte ranges concurrently into a resumable .part file, renamed when complete"""
+    head = client.head_object(Bucket=bucket, Key=key)
+    size = head['ContentLength']
+    etag = head['ETag']
+
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    part_path, state_path = part_paths(destination)
+    resume_state = {'etag': etag, 'size': size, 'range_size': range_size}
+    state = read_state(state_path)
+    completed = set(state.get('completed', [])) if part_path.exists() and all(
+        state.get(name) == value for name, value in resume_state.items()) else set()
+    if completed:
+        eprint(f'Resuming download - key: {key}, {len(completed)} range(s) already fetched')
+
+    state_lock = threading.Lock()
+    fd = os.open(str(part_path), os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        if not completed:
+            preallocate(fd, size)
+            write_state(state_path, {**resume_state, 'completed': []})
+
+        def fetch(byte_range):
+            with slot():
+                fetch_range_into(client, fd, bucket=bucket, key=key, etag=etag, byte_range=byte_range)
+            # Make the bytes durable before the state file claims them
+            os.fsync(fd)
+            with state_lock:
+                completed.add(byte_range[0])
+                write_state(state_path, {**resume_state, 'completed': sorted(completed)})
+
+        missing_ranges = [byte_range for byte_range in byte_ranges(size, range_size)
+                          if byte_range[0] not in completed]
+        for _, _, error in map_concurrently(fetch, missing_ranges, concurrency):
+            if error is not None:
+                raise error
+    finally:
+        os.close(fd)
+
+    os.replace(part_path, destination)
+    state_path.unlink()
+    return size
@@ -1,12 +1,53 @@
-import boto3
-from functools import reduce
+import os
+import re
+import threading
+import time
+from contextlib import closing
 
-from .utils import (eprint,
+from .archive import COMPRESSIONS, extract_archive, upload_archive
+from .checksums import (ALGORITHMS as VERIFY_ALGORITHMS,
+                        S3_CHECKSUM_ALGORITHMS,
+                        HashingReader,
+                        StreamDigest,
+                        file_etag,
+                        verify_digest)
+from .concurrency import ConcurrencyGovernor
+from .index_object import (empty_index,
+                           index_entry,
+                           merge_index,
+                           parse_index,
+                           response_object_from_index_entry,
+                           serialize_index)
+from .listing_cache import DEFAULT_MAX_BYTES, ListingCache, cache_entry, response_object_from_entry
+from .metrics import Metrics, file_size
+from .ranged_download import download_ranged
+from .state import state_path, read_state, write_state
+from .utils import (READ_CHUNK_SIZE,
+                    eprint,
                     deep_get,
+                    iter_version_records,
+                    map_concurrently,
+                    merge_concurrently,
+                    positive_int_option,
                     parse_semver_array_from_string,
-                    key_regexp_matches,
-                    key_regexp_max_version,
-                    key_regexp_version_not_less_than)
+                    regexp_exact_key,
+                    regexp_literal_prefix,
+                    version_from_match,
+                    VersionIndex)
+
+DEFAULT_CONCURRENCY = 10
+DEFAULT_MAX_POOL_CONNECTIONS = 10
+DEFAULT_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+DEFAULT_MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+INCREMENTAL_MODES = [None, 'lexical', 'high_water_mark']
+RETRY_MODES = [None, 'legacy', 'standard', 'adaptive']
+INDEX_UPDATE_ATTEMPTS = 5
+PIPELINE_QUEUE_SIZE = 2000
+NOT_MODIFIED = object()
+
+
+def error_code(client_error):
+    return client_error.response.get('Error', {}).get('Code')
 
 
 class ResourceBotoClient:
@@ -14,12 +55,43 @@ class ResourceBotoClient:
         self.init_source_options(input)
         self.init_version(input)
         self.init_params(input)
-        self.client = boto3.client(
-            service_name=self.service,
-            region_name=self.region,
-            aws_access_key_id=self.access_key_id,
-            aws_secret_access_key=self.secret_access_key,
-            endpoint_url=self.endpoint)
+        self.init_transfer_options(input)
+        self.governor = ConcurrencyGovernor(max(self.concurrency, self.listing_concurrency))
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        """The boto3 client, built on first use so paths that never touch S3 skip
+        importing boto3 at all."""
+        # Transfer workers may all reach this first; building more than one client would
+        # register the metrics and governor hooks twice on whichever one was kept
+        with self._client_lock:
+            if self._client is None:
+                import boto3
+                from botocore.config import Config
+
+                client = boto3.client(
+                    service_name=self.service,
+                    region_name=self.region,
+                    aws_access_key_id=self.access_key_id,
+                    aws_secret_access_key=self.secret_access_key,
+                    endpoint_url=self.endpoint,
+                    config=Config(**self.client_config_options))
+                self.metrics.instrument(client)
+                self.governor.instrument(client)
+                self._client = client
+        return self._client
+
+    @property
+    def transfer_config(self):
+        """TransferConfig for download_file/upload_file, or None to use boto3's defaults"""
+        if not self.transfer_options:
+            return None
+        if self._transfer_config is None:
+            from boto3.s3.transfer import TransferConfig
+            self._transfer_config = TransferConfig(**self.transfer_options)
+        return self._transfer_config
 
     def init_source_options(self, input):
         self.service = 's3'
@@ -33,6 +105,31 @@ class ResourceBotoClient:
         self.prefix_filter = deep_get(input, 'source', 'filters', 'prefix', default='')
         self.regexp_filter = deep_get(input, 'source', 'filters', 'regexp')
         self.version_filter = deep_get(input, 'source', 'filters', 'version')
+        self.list_prefix = self.derive_list_prefix()
+        self.keep = positive_int_option(input, 'source', 'filters', 'keep')
+        self.incremental = deep_get(input, 'source', 'filters', 'incremental')
+        if self.incremental not in INCREMENTAL_MODES:
+            raise ValueError(f'source.filters.incremental must be one of {INCREMENTAL_MODES}, '
+                             f'got {self.incremental!r}')
+
+        self.state_dir = deep_get(input, 'source', 'state_dir')
+        self.metrics = Metrics(deep_get(input, 'source', 'metrics', 'file'))
+        self.index_key = deep_get(input, 'source', 'index', 'key')
+
+        self.listing_shards = deep_get(input, 'source', 'listing', 'shards')
+        if not (self.listing_shards in [None, 'auto'] or (
+                isinstance(self.listing_shards, list)
+                and all(isinstance(boundary, str) for boundary in self.listing_shards))):
+            raise ValueError('source.listing.shards must be \'auto\' or a list of boundary keys, '
+                             f'got {self.listing_shards!r}')
+        cache_ttl = positive_int_option(input, 'source', 'cache', 'ttl')
+        self.listing_cache = None if cache_ttl is None else ListingCache(
+            self.state_dir,
+            cache_ttl,
+            positive_int_option(input, 'source', 'cache', 'max_bytes', default=DEFAULT_MAX_BYTES),
+            self.endpoint, self.bucket, self.list_prefix)
+        self.listing_concurrency = positive_int_option(input, 'source', 'listing', 'concurrency',
+                                                       default=DEFAULT_CONCURRENCY)
 
     def init_version(self, input):
         self.version_key = deep_get(input, 'version', 'key')
@@ -40,51 +137,494 @@ class ResourceBotoClient:
     def init_params(self, input):
         self.action_mode = deep_get(input, 'params', 'mode')
         self.upload_glob = deep_get(input, 'params', 'glob')
+        self.manifest = deep_get(input, 'params', 'manifest')
+        self.archive_key = deep_get(input, 'params', 'archive')
+        self.compression = deep_get(input, 'params', 'compression')
+        if self.compression not in COMPRESSIONS:
+            raise ValueError(f'params.compression must be one of {COMPRESSIONS}, got {self.compression!r}')
+        self.skip_unchanged = deep_get(input, 'params', 'skip_unchanged', default=False)
+        if self.skip_unchanged not in [False, True]:
+            raise ValueError(f'params.skip_unchanged must be a boolean, got {self.skip_unchanged!r}')
+        self.range_size = positive_int_option(input, 'params', 'range_size')
+        self.verify = deep_get(input, 'params', 'verify')
+        if self.verify not in VERIFY_ALGORITHMS:
+            raise ValueError(f'params.verify must be one of {VERIFY_ALGORITHMS}, got {self.verify!r}')
+        if self.verify is not None and self.range_size is not None:
+            raise ValueError('params.verify hashes the object as one ordered stream '
+                             'and cannot be combined with params.range_size')
+        self.concurrency = positive_int_option(input, 'params', 'concurrency', default=DEFAULT_CONCURRENCY)
 
-    def list_filtered_objects(self):
-        try:
-            response = self.client.list_objects_v2(
-                Bucket=self.bucket,
-                Prefix=self.prefix_filter)
-        except self.client.exceptions.NoSuchBucket:  # pragma: no cover
-            eprint('No versions found - no bucket')
-            return []
+    def init_transfer_options(self, input):
+        self.transfer_options = {}
+        for name in ['multipart_threshold', 'multipart_chunksize', 'max_concurrency']:
+            value = positive_int_option(input, 'source', 'transfer', name)
+            if value is not None:
+                self.transfer_options[name] = value
+        self._transfer_config = None
 
+        max_pool_connections = positive_int_option(input, 'source', 'service', 'max_pool_connections')
+        tcp_keepalive = deep_get(input, 'source', 'service', 'tcp_keepalive')
+        if tcp_keepalive not in [None, True]:
+            raise ValueError(f'source.service.tcp_keepalive must be a boolean, got {tcp_keepalive!r}')
+        retry_mode = deep_get(input, 'source', 'service', 'retry_mode')
+        if retry_mode not in RETRY_MODES:
+            raise ValueError(f'source.service.retry_mode must be one of {RETRY_MODES}, got {retry_mode!r}')
+        max_attempts = positive_int_option(input, 'source', 'service', 'max_attempts')
+
+        self.client_config_options = {
+            'max_pool_connections': max_pool_connections or max(DEFAULT_MAX_POOL_CONNECTIONS,
+                                                                self.concurrency,
+                                                                self.listing_concurrency)
+        }
+        if tcp_keepalive:
+            self.client_config_options['tcp_keepalive'] = True
+        retries = {name: value for name, value in [('mode', retry_mode), ('max_attempts', max_attempts)]
+                   if value is not None}
+        if retries:
+            self.client_config_options['retries'] = retries
+
+    def derive_list_prefix(self):
+        """Narrow the configured prefix with the literal start of the key regexp, which
+        every matching key must share, so S3 only lists keys that can possibly match."""
+        if not self.regexp_filter:
+            return self.prefix_filter
+        regexp_prefix = regexp_literal_prefix(self.regexp_filter)
+        return regexp_prefix if regexp_prefix.startswith(self.prefix_filter) else self.prefix_filter
+
+    def iter_listing_pages(self, **list_kwargs):
+        """Yield each list_objects_v2 response of one listing, following continuation tokens"""
+        list_kwargs = {'Bucket': self.bucket, **list_kwargs}
+        while True:
+            try:
+                with self.governor.slot():
+                    response = self.client.list_objects_v2(**list_kwargs)
+            except self.client.exceptions.NoSuchBucket:  # pragma: no cover
+                eprint('No versions found - no bucket')
+                return
+
+            yield response
+
+            if not response.get('IsTruncated'):
+                return
+            list_kwargs['ContinuationToken'] = response['NextContinuationToken']
+
+    def iter_shard_pages(self, prefix, start_after=None, end_key=None):
+        """Yield lists of objects with keys under prefix, after start_after and up to and
+        including end_key"""
+        list_kwargs = {'Prefix': prefix}
+        if start_after is not None:
+            list_kwargs['StartAfter'] = start_after
+        for response in self.iter_listing_pages(**list_kwargs):
+            try:
+                contents = response['Contents']
+            except KeyError:
+                eprint(f'Cannot read \'Contents\' of {response}')
+                continue
+            if end_key is not None and contents and contents[-1]['Key'] > end_key:
+                yield [obj for obj in contents if obj['Key'] <= end_key]
+                return
+            yield contents
+
+    def discover_shards(self, start_after):
+        """Split the listing into shards. Returns (shards, pages) where pages holds objects
+        found while discovering shards."""
+        if self.listing_shards == 'auto':
+            shards = []
+            pages = []
+            list_kwargs = {'Prefix': self.list_prefix, 'Delimiter': '/'}
+            if start_after is not None:
+                list_kwargs['StartAfter'] = start_after
+            for response in self.iter_listing_pages(**list_kwargs):
+                pages.append(response.get('Contents', []))
+                shards.extend((common_prefix['Prefix'], start_after, None)
+                              for common_prefix in response.get('CommonPrefixes', []))
+            return shards, pages
+
+        boundaries = sorted(self.listing_shards)
+        shards = []
+        for lower, upper in zip([None, *boundaries], [*boundaries, None]):
+            if start_after is not None:
+                if upper is not None and upper <= start_after:
+                    continue
+                lower = start_after if lower is None else max(lower, start_after)
+            shards.append((self.list_prefix, lower, upper))
+        return shards, []
+
+    def iter_listed_pages(self, start_after=None):
+        if self.listing_shards is None:
+            yield from self.iter_shard_pages(self.list_prefix, start_after)
+            return
+
+        shards, pages = self.discover_shards(start_after)
+        eprint(f'Listing {len(shards)} shard(s) with concurrency {self.listing_concurrency}')
+        yield from pages
+        yield from merge_concurrently([self.iter_shard_pages(*shard) for shard in shards],
+                                      self.listing_concurrency)
+
+    def iter_cached_pages(self, start_after=None):
+        """Pages served from the listing cache, revalidated by listing only the keys after
+        the last cached one. A missing or expired cache is rebuilt from a full listing."""
+        def after_cursor(page):
+            return page if start_after is None else [obj for obj in page if obj['Key'] > start_after]
+
+        cached = self.listing_cache.load()
+        if cached is None:
+            eprint('Listing cache miss - listing the whole prefix')
+            listed_at, last_key, entries = time.time(), None, []
+        else:
+            listed_at, last_key, entries = cached
+            eprint(f'Listing cache hit - {len(entries)} object(s), listing after: {last_key}')
+            yield after_cursor([response_object_from_entry(entry) for entry in entries])
+
+        # Always resume from last_key, never from start_after: keys between the two would
+        # otherwise be missing from the cache for good once last_key moves past them
+        new_entries = []
+        for page in self.iter_listed_pages(last_key):
+            new_entries.extend(cache_entry(obj) for obj in page)
+            yield after_cursor(page)
+
+        if cached is None or new_entries:
+            last_key = max(filter(None, [last_key, *(entry[0] for entry in new_entries)]), default=None)
+            self.listing_cache.store(listed_at, last_key, sorted(entries + new_entries))
+
+    def iter_listed_objects(self, start_after=None, cached=False):
+        """Objects under the prefix filter. Only check passes cached=True: `in` must see
+        the bucket as it is now, not as the listing cache last recorded it."""
+        if self.listing_cache is None or not cached:
+            pages = self.iter_listed_pages(start_after)
+        else:
+            pages = self.iter_cached_pages(start_after)
+        for page in pages:
+            yield from page
+
+    def high_water_mark_path(self):
+        return state_path(self.state_dir, 'high-water-mark',
+                          self.endpoint, self.bucket, self.prefix_filter, self.regexp_filter)
+
+    def incremental_start_after(self):
+        """Key to resume listing after, or None when the whole prefix must be listed"""
+        if self.version_key is None or self.incremental != 'lexical':
+            return None
+        return self.version_key
+
+    def read_high_water_mark(self):
+        """(version, mtime) of the newest record the last check selected, or None"""
+        if self.version_key is None or self.incremental != 'high_water_mark':
+            return None
+        mark = read_state(self.high_water_mark_path())
+        if 'version' not in mark:
+            return None
+        return tuple(mark['version']), mark['mtime']
+
+    def iter_candidate_objects(self, incremental):
+        """Objects the version filters should consider: the entries of the index object in
+        index mode, a single HeadObject result when the regexp names exactly one key,
+        otherwise a (possibly incremental) listing."""
+        if self.index_key is not None:
+            yield from self.iter_index_objects()
+            return
+
+        exact_key = regexp_exact_key(self.regexp_filter)
+        if exact_key is not None:
+            # A listing would only ever see keys under the prefix filter
+            if not exact_key.startswith(self.prefix_filter):
+                return
+            eprint(f'Looking up exact key: {exact_key}')
+            head_object = self.head_object(exact_key)
+            if head_object is not None:
+                yield head_object
+            return
+
+        start_after = self.incremental_start_after() if incremental else None
+        if start_after is not None:
+            eprint(f'Listing objects after: {start_after}')
+            # Concourse expects the current version back alongside anything newer
+            yield {'Key': self.version_key}
+        yield from self.iter_listed_objects(start_after=start_after, cached=incremental)
+
+    def version_selection(self):
+        """(threshold_semver, keep) implied by the version filter and keep options"""
+        if self.version_filter in [None, 'latest', 'every']:
+            threshold_semver = None
+        else:
+            threshold_semver = parse_semver_array_from_string(self.version_filter)
+
+        keep = self.keep
+        if keep is None and self.version_filter in [None, 'latest']:
+            keep = 1
+        return threshold_semver, keep
+
+    def filtered_objects(self, incremental=False):
         if not self.regexp_filter:
             eprint('No versions found - no regex')
             return []
 
-        try:
-            response_objects = response['Contents']
-        except KeyError:
-            eprint(f'Cannot read \'Contents\' of {response}')
+        threshold_semver, keep = self.version_selection()
+        listed_objects = self.metrics.timed_iter(self.iter_candidate_objects(incremental), 'list', 'filter')
+        version_index = VersionIndex(self.regexp_filter,
+                                     listed_objects,
+                                     keep=keep,
+                                     threshold_semver=threshold_semver)
+        filtered_objects = version_index.sorted_records()
+
+        if incremental and self.incremental == 'high_water_mark':
+            # Keys need not sort with versions, so the mark filters the listing rather than
+            # narrowing it; the record at the mark is the current version and is kept
+            high_water_mark = self.read_high_water_mark()
+            if high_water_mark is not None:
+                filtered_objects = [record for record in filtered_objects
+                                    if record.sort_key() >= high_water_mark]
+            if filtered_objects:
+                version, mtime = filtered_objects[-1].sort_key()
+                write_state(self.high_water_mark_path(), {'version': list(version), 'mtime': mtime})
+
+        if not filtered_objects:
             eprint('No versions found - cannot read or none found')
-            return []
+        return filtered_objects
+
+    def iter_filtered_objects(self):
+        """Filtered records, streamed while listing unless `keep` needs the full listing"""
+        threshold_semver, keep = self.version_selection()
+        if not self.regexp_filter or keep is not None:
+            yield from self.filtered_objects()
+            return
+
+        def matched_records():
+            listed_objects = self.metrics.timed_iter(self.iter_candidate_objects(False), 'list')
+            records = iter_version_records(self.regexp_filter, listed_objects, threshold_semver)
+            # select is list plus filter time; backpressure is time spent waiting on the queue
+            yield from self.metrics.timed_iter(records, 'select', 'backpressure')
+
+        found = False
+        for record in merge_concurrently([matched_records()], 1, max_pending=PIPELINE_QUEUE_SIZE):
+            found = True
+            yield record
+        if not found:
+            eprint('No versions found - cannot read or none found')
+
+    def list_filtered_objects(self, incremental=False):
+        return [{'key': record.key} for record in self.filtered_objects(incremental=incremental)]
+
+    def head_object(self, key):
+        """Listing-style entry for key, or None if there is no such object"""
+        from botocore.exceptions import ClientError
+
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as error:
+            if error_code(error) in ['404', 'NoSuchKey', 'NotFound']:
+                return None
+            raise
+        return {
+            'Key': key,
+            'LastModified': response.get('LastModified'),
+            'ETag': response.get('ETag'),
+            'Size': response.get('ContentLength')
+        }
 
-        matching_objects = list(filter(key_regexp_matches(self.regexp_filter), response_objects))
+    def get_index_object(self, if_none_match=None):
+        """(etag, document) of the index object, an empty index if it does not exist yet,
+        or NOT_MODIFIED when its ETag still equals if_none_match"""
+        from botocore.exceptions import ClientError
 
-        if self.version_filter == 'every':
-            filtered_objects = matching_objects
-        elif self.version_filter in [None, 'latest']:
-            filtered_objects = reduce(key_regexp_max_version(self.regexp_filter), matching_objects, [])
+        get_kwargs = {'Bucket': self.bucket, 'Key': self.index_key}
+        if if_none_match is not None:
+            get_kwargs['IfNoneMatch'] = if_none_match
+        try:
+            response = self.client.get_object(**get_kwargs)
+        except ClientError as error:
+            if error_code(error) in ['304', 'NotModified']:
+                return NOT_MODIFIED
+            if error_code(error) in ['404', 'NoSuchKey']:
+                return None, empty_index()
+            raise
+        with closing(response['Body']) as body:
+            return response['ETag'], parse_index(body.read())
+
+    def iter_index_objects(self):
+        cache_path = state_path(self.state_dir, 'index', self.endpoint, self.bucket, self.index_key)
+        cached = read_state(cache_path)
+        result = self.get_index_object(if_none_match=cached.get('etag'))
+        if result is NOT_MODIFIED:
+            eprint(f'Index object not modified: {self.index_key}')
+            document = cached['document']
         else:
-            threshold_semver = parse_semver_array_from_string(self.version_filter)
-            filtered_objects = list(filter(key_regexp_version_not_less_than(self.regexp_filter,
-                                                                            threshold_semver),
-                                    matching_objects))
+            etag, document = result
+            eprint(f'Index object fetched: {self.index_key}, etag: {etag}')
+            if etag is not None:
+                write_state(cache_path, {'etag': etag, 'document': document})
+        for entry in document['objects']:
+            yield response_object_from_index_entry(entry)
+
+    def update_index(self, keys):
+        """Record the uploaded keys that are versions in the index object. The index is
+        replaced with a conditional PUT, re-read and retried if another writer won."""
+        from botocore.exceptions import ClientError
 
-        object_keys = [{'key': obj['Key']} for obj in filtered_objects]
-        return object_keys
+        pattern = re.compile(self.regexp_filter or '')
+        matches = [(key, pattern.match(key)) for key in keys if key != self.index_key]
+        versions = {key: version_from_match(match) for key, match in matches if match is not None}
+
+        entries = []
+        for key, head_object, error in map_concurrently(self.head_object, versions, self.concurrency):
+            if error is not None:
+                raise error
+            if head_object is not None:
+                entries.append(index_entry(head_object, versions[key]))
+
+        for _ in range(INDEX_UPDATE_ATTEMPTS):
+            etag, document = self.get_index_object()
+            condition = {'IfMatch': etag} if etag is not None else {'IfNoneMatch': '*'}
+            try:
+                self.client.put_object(
+                    Bucket=self.bucket,
+                    Key=self.index_key,
+                    Body=serialize_index(merge_index(document, entries)),
+                    ContentType='application/json',
+                    **condition)
+                return len(entries)
+            except ClientError as error:
+                if error_code(error) not in ['PreconditionFailed', 'ConditionalRequestConflict',
+                                             '412', '409']:
+                    raise
+                eprint(f'Index object changed concurrently, retrying: {self.index_key}')
+        raise RuntimeError(f'Could not update index object {self.index_key} '
+                           f'after {INDEX_UPDATE_ATTEMPTS} attempts')
+
+    def transfer_kwargs(self):
+        transfer_config = self.transfer_config
+        return {} if transfer_config is None else {'Config': transfer_config}
 
     def download_file(self, *, key, destination):
         destination.parent.mkdir(parents=True, exist_ok=True)
-        self.client.download_file(
-            Bucket=self.bucket,
-            Key=key,
-            Filename=str(destination))
+        with self.governor.slot(), self.metrics.phase('download') as span:
+            if self.verify is not None:
+                self.download_file_verified(key=key, destination=destination)
+            else:
+                self.client.download_file(
+                    Bucket=self.bucket,
+                    Key=key,
+                    Filename=str(destination),
+                    **self.transfer_kwargs())
+            span['bytes'] = file_size(destination)
+
+    def download_file_ranged(self, *, key, destination):
+        """Download one object as `range_size` byte ranges fetched on `concurrency` workers"""
+        with self.metrics.phase('download') as span:
+            download_ranged(self.client,
+                            bucket=self.bucket,
+                            key=key,
+                            destination=destination,
+                            range_size=self.range_size,
+                            concurrency=self.concurrency,
+                            slot=self.governor.slot)
+            span['bytes'] = file_size(destination)
+
+    def transfer_files(self, transfer, transfers):
+        """Call transfer(**kwargs) for each kwargs dict on a pool of `concurrency` workers
+        sharing this client, yielding (key, exception) as each finishes."""
+        def run(kwargs):
+            transfer(**kwargs)
+
+        for kwargs, _, error in map_concurrently(run, transfers, self.concurrency):
+            yield kwargs['key'], error
+
+    def download_files(self, downloads):
+        """Download (key, destination) pairs concurrently, yielding (key, exception)"""
+        return self.transfer_files(self.download_file, ({'key': key, 'destination': destination}
+                                                        for key, destination in downloads))
+
+    def download_file_verified(self, *, key, destination):
+        """Stream the object to a .part file, checksumming the bytes on their way to disk,
+        and move it to destination only once it verifies"""
+        response = self.client.get_object(Bucket=self.bucket, Key=key, ChecksumMode='ENABLED')
+        digest = StreamDigest(self.verify)
+        part_path = destination.with_name(destination.name + '.part')
+        try:
+            with open(part_path, 'wb') as f, closing(response['Body']) as body:
+                for chunk in body.iter_chunks(READ_CHUNK_SIZE):
+                    digest.update(chunk)
+                    f.write(chunk)
+            verify_digest(key, digest, response)
+        except BaseException:
+            try:
+                os.unlink(part_path)
+            except OSError:
+                pass
+            raise
+        os.replace(part_path, destination)
 
     def upload_file(self, *, source, key):
-        self.client.upload_file(
-            Filename=source,
-            Bucket=self.bucket,
-            Key=key)
+        with self.governor.slot(), self.metrics.phase('upload') as span:
+            span['bytes'] = file_size(source)
+            if self.verify is not None:
+                self.upload_file_verified(source=source, key=key)
+            else:
+                self.client.upload_file(
+                    Filename=source,
+                    Bucket=self.bucket,
+                    Key=key,
+                    **self.transfer_kwargs())
+
+    def upload_file_verified(self, *, source, key):
+        """Upload source through a hashing reader, then compare with what S3 stored. For
+        sha256 and crc32c, S3 also checks the checksum it is sent as the parts arrive."""
+        digest = StreamDigest(self.verify,
+                              part_size=self.transfer_options.get('multipart_chunksize',
+                                                                  DEFAULT_MULTIPART_CHUNKSIZE),
+                              multipart_threshold=self.transfer_options.get('multipart_threshold',
+                                                                            DEFAULT_MULTIPART_THRESHOLD))
+        extra_args = {}
+        if self.verify in S3_CHECKSUM_ALGORITHMS:
+            extra_args['ChecksumAlgorithm'] = S3_CHECKSUM_ALGORITHMS[self.verify]
+        with open(source, 'rb') as f:
+            self.client.upload_fileobj(
+                HashingReader(f, digest),
+                self.bucket,
+                key,
+                ExtraArgs=extra_args,
+                **self.transfer_kwargs())
+        head = self.client.head_object(Bucket=self.bucket, Key=key, ChecksumMode='ENABLED')
+        verify_digest(key, digest, head)
+
+    def upload_archive(self, members):
+        """Stream (path, name) members into a tar uploaded as the archive_key object"""
+        def upload_fileobj(fileobj):
+            self.client.upload_fileobj(fileobj, self.bucket, self.archive_key, **self.transfer_kwargs())
+
+        with self.metrics.phase('archive'):
+            return upload_archive(upload_fileobj, members, self.compression)
+
+    def download_archive(self, *, key, dest_path):
+        """Extract the tar object at key into dest_path while it streams in"""
+        response = self.client.get_object(Bucket=self.bucket, Key=key)
+        with self.metrics.phase('extract'), closing(response['Body']) as body:
+            return extract_archive(body, dest_path, self.compression)
+
+    def remote_objects(self, prefix):
+        """Size and ETag of every object under prefix, from a single listing"""
+        return {obj['Key']: (obj.get('Size'), obj.get('ETag'))
+                for page in self.iter_shard_pages(prefix) for obj in page}
+
+    def iter_changed_uploads(self, uploads, remote_objects):
+        """Pass on the (source, key) uploads whose file differs from the remote object in
+        size or ETag. Files are hashed on `concurrency` workers to keep pace with uploads."""
+        part_size = self.transfer_options.get('multipart_chunksize', DEFAULT_MULTIPART_CHUNKSIZE)
+
+        def changed(upload):
+            source, key = upload
+            remote_size, remote_etag = remote_objects.get(key, (None, None))
+            if remote_etag is None or os.path.getsize(source) != remote_size:
+                return True
+            return file_etag(source, part_size if '-' in remote_etag else None) != remote_etag
+
+        for upload, is_changed, error in map_concurrently(changed, uploads, self.concurrency):
+            if error is not None or is_changed:
+                yield upload
+            else:
+                eprint('Skipping unchanged object: ' + upload[1])
+
+    def upload_files(self, uploads):
+        """Upload (source, key) pairs concurrently, yielding (key, exception)"""
+        return self.transfer_files(self.upload_file, ({'source': source, 'key': key}
+                                                      for source, key in uploads))
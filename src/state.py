@@ -0,0 +1,44 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+
+def default_state_dir():
+    import tempfile
+    return Path(tempfile.gettempdir()) / 's3-resource-revamp'
+
+
+def state_path(state_dir, kind, *identity):
+    """Path of the state file of `kind` belonging to the resource described by `identity`"""
+    state_dir = state_dir or default_state_dir()
+    digest = hashlib.sha256(json.dumps(identity).encode()).hexdigest()[:32]
+    return Path(state_dir) / f'{kind}-{digest}.json'
+
+
+def read_state(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_state(path, state):
+    write_text_atomically(path, json.dumps(state))
+
+
+def write_text_atomically(path, text):
+    """Replace the file atomically so concurrent readers never see a partial file"""
+    import tempfile
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
@@ -0,0 +1,45 @@
+import json
+import os
+from pathlib import Path
+
+from .state import write_state
+
+
+def scan_files(root):
+    """Relative POSIX paths of every file under root, gathered in one os.scandir walk"""
+    found = set()
+    directories = [('', str(root))]
+    while directories:
+        relative_dir, directory = directories.pop()
+        try:
+            entries = os.scandir(directory)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        with entries:
+            for entry in entries:
+                relative_path = relative_dir + entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append((relative_path + '/', entry.path))
+                else:
+                    found.add(relative_path)
+    return found
+
+
+def manifest_entry(record):
+    return {
+        'etag': record.etag,
+        'size': record.size,
+        'last_modified': record.mtime
+    }
+
+
+def load_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_manifest(path, manifest):
+    write_state(Path(path), manifest)
@@ -1,66 +1,278 @@
+import heapq
 import sys
 import re
+from contextlib import contextmanager
+from datetime import datetime
 from functools import reduce
 
+try:
+    from re import _parser as sre_parse
+except ImportError:  # pragma: no cover - Python < 3.11
+    import sre_parse
 
-def deep_get(initial_dict, *path, default=None):
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+def deep_find(initial_dict, *path):
+    """Like deep_get, but falsy values such as 0 are returned rather than replaced"""
     def inner_dict_or_none(acc, step):
         try:
             return acc.get(step)
         except AttributeError:
             return None
-    return reduce(inner_dict_or_none, path, initial_dict) or default
+    return reduce(inner_dict_or_none, path, initial_dict)
+
+
+def deep_get(initial_dict, *path, default=None):
+    return deep_find(initial_dict, *path) or default
+
+
+def parse_positive_int(value, option_name):
+    if isinstance(value, bool) or not str(value).strip().isdigit() or int(value) < 1:
+        raise ValueError(f'{option_name} must be a positive integer, got {value!r}')
+    return int(value)
+
+
+def positive_int_option(input, *path, default=None):
+    """The positive integer at path, or default only when it is not set at all"""
+    value = deep_find(input, *path)
+    return default if value is None else parse_positive_int(value, '.'.join(path))
 
 
 def parse_semver_array_from_string(semver_string):
     return [int(x) for x in semver_string.split('.')]
 
 
-def version_from_response_object(response_object, regexp_filter):
-    key = response_object['Key']
-    match = re.match(regexp_filter, key)
+def regexp_literal_prefix(regexp_filter):
+    """Longest literal string that every key matched by regexp_filter starts with"""
+    if re.compile(regexp_filter).flags & re.IGNORECASE:
+        return ''
+
+    def literal_prefix(subpattern):
+        prefix = ''
+        for op, arg in subpattern:
+            if op is sre_parse.LITERAL:
+                prefix += chr(arg)
+            elif op is sre_parse.AT and arg in (sre_parse.AT_BEGINNING, sre_parse.AT_BEGINNING_STRING):
+                continue
+            elif op is sre_parse.SUBPATTERN:
+                group, add_flags, del_flags, group_items = arg
+                if add_flags & re.IGNORECASE:
+                    return prefix, False
+                group_prefix, complete = literal_prefix(group_items)
+                prefix += group_prefix
+                if not complete:
+                    return prefix, False
+            else:
+                return prefix, False
+        return prefix, True
+
+    return literal_prefix(sre_parse.parse(regexp_filter))[0]
+
+
+def regexp_exact_key(regexp_filter):
+    """The one key regexp_filter can match when it is an anchored, group-free literal
+    such as `file\\.txt$`, otherwise None"""
+    if re.compile(regexp_filter).flags & re.IGNORECASE:
+        return None
+    key = ''
+    items = list(sre_parse.parse(regexp_filter))
+    if not items or items[-1] not in [(sre_parse.AT, sre_parse.AT_END),
+                                      (sre_parse.AT, sre_parse.AT_END_STRING)]:
+        return None
+    for position, (op, arg) in enumerate(items[:-1]):
+        if op is sre_parse.LITERAL:
+            key += chr(arg)
+        elif not (position == 0 and op is sre_parse.AT and arg is sre_parse.AT_BEGINNING):
+            return None
+    return key or None
+
+
+def glob_literal_prefix(glob_pattern):
+    """Leading directories of a Path.glob pattern that hold no wildcards, as a key prefix"""
+    prefix = ''
+    for part in glob_pattern.split('/')[:-1]:
+        if any(wildcard in part for wildcard in '*?['):
+            break
+        prefix += part + '/'
+    return prefix
+
+
+def last_modified_timestamp(last_modified):
+    """Seconds since the epoch for a LastModified value, whether botocore parsed it
+    into a datetime or it came from raw JSON. Missing values sort as oldest."""
+    if last_modified is None:
+        return 0.0
+    if isinstance(last_modified, (int, float)):
+        return float(last_modified)
+    if isinstance(last_modified, str):
+        iso_string = re.sub(r'(Z|[+-]00:?00)$', '+0000', last_modified)
+        try:
+            last_modified = datetime.strptime(iso_string, '%Y-%m-%dT%H:%M:%S.%f%z')
+        except ValueError:
+            last_modified = datetime.strptime(iso_string, '%Y-%m-%dT%H:%M:%S%z')
+    return last_modified.timestamp()
+
+
+def version_from_match(match):
     groups = match.groups()
     if len(groups) == 0:
-        return -1
+        return ()
     elif len(groups) == 1:
-        version = parse_semver_array_from_string(groups[0])
+        version_group = groups[0]
     else:
         version_group = match.group('version')
-        version = parse_semver_array_from_string(version_group)
-    return version
+    return tuple(parse_semver_array_from_string(version_group))
+
+
+class ObjectRecord:
+    """The parts of a listed object that filtering and syncing need. Listing responses
+    carry much more (StorageClass, Owner, ...), so only these are kept per object."""
+    __slots__ = ('key', 'version', 'mtime', 'size', 'etag')
+
+    def __init__(self, key, version=(), mtime=0.0, size=None, etag=None):
+        self.key = key
+        self.version = version
+        self.mtime = mtime
+        self.size = size
+        self.etag = etag
+
+    @classmethod
+    def from_response_object(cls, response_object, version):
+        return cls(response_object['Key'],
+                   version,
+                   last_modified_timestamp(response_object.get('LastModified')),
+                   response_object.get('Size'),
+                   response_object.get('ETag'))
+
+    def sort_key(self):
+        return self.version, self.mtime
+
+    def __repr__(self):
+        return (f'ObjectRecord(key={self.key!r}, version={self.version!r}, mtime={self.mtime!r}, '
+                f'size={self.size!r}, etag={self.etag!r})')
+
+
+def iter_version_records(regexp_filter, response_objects, threshold_semver=None):
+    """Records of the objects whose key matches regexp_filter, in listing order, each
+    yielded as soon as its listing entry arrives. Versions below threshold_semver are
+    skipped."""
+    pattern = re.compile(regexp_filter)
+    threshold = None if threshold_semver is None else tuple(threshold_semver)
+    for response_object in response_objects:
+        match = pattern.match(response_object['Key'])
+        if match is None:
+            continue
+        record = ObjectRecord.from_response_object(response_object, version_from_match(match))
+        if threshold is not None and record.version < threshold:
+            continue
+        yield record
 
 
-def key_regexp_matches(regexp_filter):
-    def partial(response_object):
-        key = response_object['Key']
-        match = re.match(regexp_filter, key)
-        return match is not None
-    return partial
+class VersionIndex:
+    """Records matching a key regexp; with `keep`, only the newest N, held in a min-heap"""
 
+    def __init__(self, regexp_filter, response_objects, keep=None, threshold_semver=None):
+        self.keep = keep
+        self.records = []
+        records = iter_version_records(regexp_filter, response_objects, threshold_semver)
+        for sequence, record in enumerate(records):
+            if keep is None:
+                self.records.append(record)
+                continue
+            # On a full tie the earlier listed object wins, hence the negated sequence
+            heap_entry = (record.sort_key(), -sequence, record)
+            if len(self.records) < keep:
+                heapq.heappush(self.records, heap_entry)
+            else:
+                heapq.heappushpop(self.records, heap_entry)
 
-def key_regexp_max_version(regexp_filter):
-    def partial(last_max, response_object):
-        if len(last_max) == 0:
-            return [response_object]
+    def sorted_records(self):
+        """Selected records, oldest version first, ties broken by LastModified"""
+        if self.keep is None:
+            return sorted(self.records, key=ObjectRecord.sort_key)
+        return [record for _, _, record in sorted(self.records)]
 
-        this_object_version = version_from_response_object(response_object, regexp_filter)
-        last_max_version = version_from_response_object(last_max[0], regexp_filter)
 
-        if this_object_version == last_max_version:
-            this_object_version = response_object['LastModified']
-            last_max_version = last_max[0]['LastModified']
+def map_concurrently(func, items, concurrency):
+    """Call func on each item using up to `concurrency` threads, yielding
+    (item, result, exception) as calls finish. The exception is None on success.
+    Items are pulled lazily so at most twice `concurrency` calls are queued.
+    """
+    from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
-        if this_object_version > last_max_version:
-            return [response_object]
-        return last_max
-    return partial
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = {}
+
+        def finished(return_when):
+            done, _ = wait(pending, return_when=return_when)
+            for future in done:
+                error = future.exception()
+                yield pending.pop(future), None if error is not None else future.result(), error
+
+        for item in items:
+            if len(pending) >= concurrency * 2:
+                yield from finished(FIRST_COMPLETED)
+            pending[executor.submit(func, item)] = item
+        while pending:
+            yield from finished(FIRST_COMPLETED)
+
+
+def merge_concurrently(iterables, concurrency, max_pending=None):
+    """Drain iterables on up to `concurrency` threads, yielding their items in arrival
+    order. At most `max_pending` items wait for the consumer, so a slow consumer holds
+    the producers back. The first exception raised by any iterable is re-raised here.
+    """
+    import queue
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    iterables = list(iterables)
+    pending = queue.Queue(maxsize=max_pending or concurrency * 2)
+    stopped = threading.Event()
+
+    def put(message):
+        while not stopped.is_set():
+            try:
+                pending.put(message, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def drain(iterable):
+        try:
+            if stopped.is_set():
+                return
+            for item in iterable:
+                if not put(('item', item)):
+                    return
+        except BaseException as error:
+            put(('error', error))
+        finally:
+            put(('done', None))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for iterable in iterables:
+            executor.submit(drain, iterable)
+        remaining = len(iterables)
+        try:
+            while remaining:
+                kind, payload = pending.get()
+                if kind == 'done':
+                    remaining -= 1
+                elif kind == 'error':
+                    raise payload
+                else:
+                    yield payload
+        finally:
+            stopped.set()
 
 
-def key_regexp_version_not_less_than(regexp_filter, threshold_semver):
-    def partial(response_object):
-        this_object_version = version_from_response_object(response_object, regexp_filter)
-        return not this_object_version < threshold_semver
-    return partial
+@contextmanager
+def null_context():
+    """A context manager that does nothing (contextlib.nullcontext needs Python 3.7)"""
+    yield
 
 
 def eprint(*args, **kwargs):
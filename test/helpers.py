@@ -22,9 +22,134 @@ def make_stream(json_compat_dict):
     return stream
 
 
-def mock_s3_client(mocker, *, list_response=None):
+def paginate_list_response(list_response, page_size):
+    contents = list_response['Contents']
+    pages = [{'Contents': contents[start:start + page_size]}
+             for start in range(0, len(contents), page_size)]
+    for page_number, page in enumerate(pages[:-1]):
+        page['IsTruncated'] = True
+        page['NextContinuationToken'] = f'token-{page_number}'
+    return pages
+
+
+def mock_s3_client(mocker, *, list_response=None, list_responses=None):
     mock_client = mocker.Mock()
-    mock_client.list_objects_v2 = mocker.Mock(return_value=list_response)
+    if list_responses is not None:
+        mock_client.list_objects_v2 = mocker.Mock(side_effect=list_responses)
+    else:
+        mock_client.list_objects_v2 = mocker.Mock(return_value=list_response)
     mock_client.download_file = mocker.Mock()
     mock_client.upload_file = mocker.Mock()
     return mock_client
+
+
+def fake_list_objects_v2(contents, page_size=1000):
+    """list_objects_v2 stand-in honouring Prefix, StartAfter, Delimiter and continuation"""
+    contents = sorted(contents, key=lambda obj: obj['Key'])
+
+    def list_objects_v2(*, Bucket, Prefix='', StartAfter=None, Delimiter=None, ContinuationToken=None):
+        after = ContinuationToken or StartAfter or ''
+        entries = []
+        for obj in contents:
+            key = obj['Key']
+            if not key.startswith(Prefix) or key <= after:
+                continue
+            if Delimiter and Delimiter in key[len(Prefix):]:
+                common_prefix = key[:key.index(Delimiter, len(Prefix)) + 1]
+                # Kept even when it sorts before StartAfter, as long as it holds a later key
+                if entries and entries[-1][0] == common_prefix:
+                    continue
+                entries.append((common_prefix, None))
+            else:
+                entries.append((key, obj))
+        page = entries[:page_size]
+        response = {
+            'Contents': [obj for _, obj in page if obj is not None],
+            'CommonPrefixes': [{'Prefix': name} for name, obj in page if obj is None]
+        }
+        if len(entries) > page_size:
+            response['IsTruncated'] = True
+            last_name, last_obj = page[-1]
+            # Skip the rest of a common prefix when resuming after it
+            response['NextContinuationToken'] = last_name if last_obj else last_name + '\U0010ffff'
+        return response
+    return list_objects_v2
+
+
+class FakeIndexStore:
+    """get_object/put_object stand-ins for a single index object with ETag preconditions"""
+
+    def __init__(self):
+        self.body = None
+        self.etag = None
+        self.puts = 0
+
+    def get_object(self, *, Bucket, Key, IfNoneMatch=None):
+        from botocore.exceptions import ClientError
+
+        if self.body is None:
+            raise ClientError({'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+        if IfNoneMatch == self.etag:
+            raise ClientError({'Error': {'Code': '304'}}, 'GetObject')
+        return {'ETag': self.etag, 'Body': io.BytesIO(self.body)}
+
+    def put_object(self, *, Bucket, Key, Body, ContentType, IfMatch=None, IfNoneMatch=None):
+        from botocore.exceptions import ClientError
+
+        if (IfNoneMatch == '*' and self.body is not None) or (IfMatch is not None and IfMatch != self.etag):
+            raise ClientError({'Error': {'Code': 'PreconditionFailed'}}, 'PutObject')
+        self.puts += 1
+        self.body = Body
+        self.etag = f'"index-{self.puts}"'
+
+
+class FakeObjectBody:
+    """A botocore StreamingBody stand-in over in-memory bytes"""
+
+    def __init__(self, data):
+        self.stream = io.BytesIO(data)
+
+    def read(self, amt=None):
+        return self.stream.read(amt)
+
+    def iter_chunks(self, chunk_size=1024):
+        while True:
+            chunk = self.stream.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        self.stream.close()
+
+    def __enter__(self):
+        # Like botocore's StreamingBody, entering yields the raw stream, not the body
+        return self.stream
+
+    def __exit__(self, *exc_info):
+        self.stream.close()
+
+
+def fake_object_store(mocker, mock_client, objects):
+    """Serve head_object and (ranged) get_object from a dict of key -> bytes"""
+    def etag(key):
+        return f'"etag-{len(objects[key])}"'
+
+    def head_object(*, Bucket, Key, **kwargs):
+        return {'ContentLength': len(objects[Key]), 'ETag': etag(Key),
+                'LastModified': '2019-11-21T22:10:17.130Z'}
+
+    def get_object(*, Bucket, Key, Range=None, IfMatch=None, **kwargs):
+        from botocore.exceptions import ClientError
+
+        if IfMatch is not None and IfMatch != etag(Key):
+            raise ClientError({'Error': {'Code': 'PreconditionFailed'}}, 'GetObject')
+        data = objects[Key]
+        if Range is not None:
+            start, end = (int(bound) for bound in Range[len('bytes='):].split('-'))
+            data = data[start:end + 1]
+        return {'Body': FakeObjectBody(data), 'ContentLength': len(data), 'ETag': etag(Key)}
+
+    mock_client.head_object = mocker.Mock(side_effect=head_object)
+    mock_client.get_object = mocker.Mock(side_effect=get_object)
+    return mock_client
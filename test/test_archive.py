@@ -0,0 +1,85 @@
+import io
+import tarfile
+
+import pytest
+
+from src import archive
+
+
+def archive_bytes(members, compression=None):
+    buffer = io.BytesIO()
+    archive.write_archive(buffer, members, compression)
+    return buffer.getvalue()
+
+
+class TestArchive:
+    def test_upload_archive_streams_through_pipe(self, tmp_path):
+        for number in range(3):
+            (tmp_path / f'{number}.txt').write_bytes(b'x' * 100000 * number)
+        received = io.BytesIO()
+
+        def upload_fileobj(fileobj):
+            while True:
+                chunk = fileobj.read(8192)
+                if not chunk:
+                    return
+                received.write(chunk)
+
+        members = ((str(tmp_path / f'{number}.txt'), f'dir/{number}.txt') for number in range(3))
+        assert archive.upload_archive(upload_fileobj, members, 'gzip') == 3
+        received.seek(0)
+        with tarfile.open(fileobj=received, mode='r:gz') as result:
+            assert result.getnames() == ['dir/0.txt', 'dir/1.txt', 'dir/2.txt']
+            assert result.extractfile('dir/2.txt').read() == b'x' * 200000
+
+    def test_upload_archive_writer_failure_never_reaches_eof(self, tmp_path):
+        (tmp_path / 'a.txt').write_bytes(b'a')
+        reads = []
+
+        def upload_fileobj(fileobj):
+            while True:
+                chunk = fileobj.read(8192)
+                if not chunk:
+                    reads.append('eof')
+                    return
+                reads.append(chunk)
+
+        def members():
+            yield str(tmp_path / 'a.txt'), 'a.txt'
+            raise OSError('disk went away')
+
+        with pytest.raises(OSError, match='disk went away'):
+            archive.upload_archive(upload_fileobj, members(), None)
+        assert 'eof' not in reads
+
+    def test_upload_archive_reports_upload_failure(self, tmp_path):
+        (tmp_path / 'a.txt').write_bytes(b'a' * 1000000)
+
+        def upload_fileobj(fileobj):
+            fileobj.read(10)
+            raise RuntimeError('access denied')
+
+        with pytest.raises(RuntimeError, match='access denied'):
+            archive.upload_archive(upload_fileobj, [(str(tmp_path / 'a.txt'), 'a.txt')], None)
+
+    @pytest.mark.parametrize('compression', archive.COMPRESSIONS)
+    def test_extract_archive_round_trip(self, tmp_path, compression):
+        (tmp_path / 'src').mkdir()
+        (tmp_path / 'src' / 'page.html').write_bytes(b'<html/>')
+        data = archive_bytes([(str(tmp_path / 'src' / 'page.html'), 'book/page.html')], compression)
+        dest = tmp_path / 'dest'
+        dest.mkdir()
+        assert archive.extract_archive(io.BytesIO(data), str(dest), compression) == 1
+        assert (dest / 'book' / 'page.html').read_bytes() == b'<html/>'
+
+    def test_extract_archive_rejects_escaping_members(self, tmp_path):
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w') as evil:
+            info = tarfile.TarInfo('../escaped.txt')
+            info.size = 1
+            evil.addfile(info, io.BytesIO(b'x'))
+        dest = tmp_path / 'dest'
+        dest.mkdir()
+        with pytest.raises(Exception):
+            archive.extract_archive(io.BytesIO(buffer.getvalue()), str(dest), None)
+        assert not (tmp_path / 'escaped.txt').exists()
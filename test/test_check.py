@@ -1,13 +1,18 @@
+import json
 from io import StringIO
 from contextlib import redirect_stderr
 
 import pytest
+from botocore.exceptions import ClientError
 
 from src.action_check import action_check
 
 from .helpers import (read_json_file_as_dict,
                       make_stream,
-                      mock_s3_client)
+                      mock_s3_client,
+                      paginate_list_response,
+                      fake_list_objects_v2,
+                      FakeIndexStore)
 
 
 class TestCheck:
@@ -38,6 +43,28 @@ class TestCheck:
             assert result == []
             assert 'No versions found - cannot read or none found' in stderr_output.getvalue()
 
+    def test_check_summarizes_instead_of_listing_versions(self, mocker):
+        response = read_json_file_as_dict('list-objects-v2-full-bucket.json')
+        mock_client = mock_s3_client(mocker, list_response=response)
+        mocker.patch('boto3.client', return_value=mock_client)
+        stderr_output = StringIO()
+        with redirect_stderr(stderr_output):
+            input = {
+                'source': {
+                    'filters': {
+                        'regexp': '.*',
+                        'version': 'every'
+                    }
+                }
+            }
+            result = action_check(make_stream(input))
+        lines = stderr_output.getvalue().splitlines()
+        assert f'Versions found: {len(result)}, latest: {result[-1]["key"]}' in lines
+        assert result[0]['key'] not in stderr_output.getvalue()
+        summary = json.loads(next(line for line in lines if line.startswith('{')))['metrics']
+        assert summary['action'] == 'check'
+        assert set(summary['phases']) == {'list', 'filter'}
+
     def test_check_minio_exact_match_latest(self, mocker):
         response = read_json_file_as_dict('list-objects-v2-minio.json')
         mock_client = mock_s3_client(mocker, list_response=response)
@@ -174,3 +201,391 @@ class TestCheck:
         result = action_check(make_stream(input))
         assert len(result) == 1
         assert 'm63248' in result[0]['key']
+
+    def test_check_follows_continuation_tokens(self, mocker):
+        response = read_json_file_as_dict('list-objects-v2-full-bucket.json')
+        pages = paginate_list_response(response, 100)
+        mock_client = mock_s3_client(mocker, list_responses=pages)
+        mocker.patch('boto3.client', return_value=mock_client)
+        input = {
+            'source': {
+                'filters': {
+                    'regexp': r'book/m(?P<version>\d+)/.*',
+                    'version': 'every'
+                }
+            }
+        }
+        result = action_check(make_stream(input))
+        assert len(result) == 1259
+        assert mock_client.list_objects_v2.call_count == len(pages)
+        last_call = mock_client.list_objects_v2.call_args_list[-1]
+        assert last_call[1]['ContinuationToken'] == f'token-{len(pages) - 2}'
+
+    def test_check_incremental_lexical_lists_after_current_version(self, mocker):
+        response = {
+            'Contents': [
+                {'Key': 'builds/1.0.2/book.zip', 'LastModified': '2019-11-22T06:04:34.232Z'}
+            ]
+        }
+        mock_client = mock_s3_client(mocker, list_response=response)
+        mocker.patch('boto3.client', return_value=mock_client)
+        input = {
+            'source': {
+                'filters': {
+                    'regexp': r'builds/(\d+\.\d+\.\d+)/book\.zip',
+                    'version': 'every',
+                    'incremental': 'lexical'
+                }
+            },
+            'version': {
+                'key': 'builds/1.0.1/book.zip'
+            }
+        }
+        result = action_check(make_stream(input))
+        assert result == [{'key': 'builds/1.0.1/book.zip'}, {'key': 'builds/1.0.2/book.zip'}]
+        assert mock_client.list_objects_v2.call_args[1]['StartAfter'] == 'builds/1.0.1/book.zip'
+
+    def test_check_incremental_lexical_keeps_current_version_when_nothing_new(self, mocker):
+        mock_client = mock_s3_client(mocker, list_response={})
+        mocker.patch('boto3.client', return_value=mock_client)
+        input = {
+            'source': {
+                'filters': {
+                    'regexp': r'builds/(\d+\.\d+\.\d+)/book\.zip',
+                    'incremental': 'lexical'
+                }
+            },
+            'version': {
+                'key': 'builds/1.0.1/book.zip'
+            }
+        }
+        result = action_check(make_stream(input))
+        assert result == [{'key': 'builds/1.0.1/book.zip'}]
+
+    def test_check_incremental_high_water_mark(self, mocker, tmp_path):
+        def book(version, last_modified):
+            return {'Key': f'book/{version}/book.zip', 'LastModified': last_modified}
+
+        contents = [book('1.9.0', '2019-11-21T22:10:17.130Z')]
+        mock_client = mock_s3_client(mocker)
+        mock_client.list_objects_v2.side_effect = fake_list_objects_v2(contents)
+        mocker.patch('boto3.client', return_value=mock_client)
+        input = {
+            'source': {
+                'state_dir': str(tmp_path),
+                'filters': {
+                    'regexp': r'book/(\d+\.\d+\.\d+)/book\.zip',
+                    'version': 'every',
+                    'incremental': 'high_water_mark'
+                }
+            }
+        }
+        assert action_check(make_stream(input)) == [{'key': 'book/1.9.0/book.zip'}]
+
+        # 1.10.0 sorts before the mark's key, and 1.2.0 is older than the mark
+        contents += [book('1.10.0', '2019-11-22T22:10:17.130Z'), book('1.2.0', '2019-11-23T22:10:17.130Z')]
+        mock_client.list_objects_v2.side_effect = fake_list_objects_v2(contents)
+        input['version'] = {'key': 'book/1.9.0/book.zip'}
+        assert action_check(make_stream(input)) == [{'key': 'book/1.9.0/book.zip'},
+                                                    {'key': 'book/1.10.0/book.zip'}]
+        assert 'StartAfter' not in mock_client.list_objects_v2.call_args[1]
+
+        input['version'] = {'key': 'book/1.10.0/book.zip'}
+        assert action_check(make_stream(input)) == [{'key': 'book/1.10.0/book.zip'}]
+
+    def test_check_incremental_invalid_mode(self, mocker):
+        mocker.patch('boto3.client', return_value=mock_s3_client(mocker))
+        input = {
+            'source': {
+                'filters': {
+                    'regexp': 'file.txt',
+                    'incremental': 'sometimes'
+                }
+            }
+        }
+        with pytest.raises(ValueError):
+            action_check(make_stream(input))
+
+    def test_check_prefix_derived_from_regexp(self, mocker):
+        response = read_json_file_as_dict('list-objects-v2-full-bucket.json')
+        mock_client = mock_s3_client(mocker, list_response=response)
+        mocker.patch('boto3.client', return_value=mock_client)
+        input = {
+            'source': {
+                'filters': {
+                    'prefix': 'book/',
+                    'regexp': r'book/m(?P<version>\d+)/.*'
+                }
+            }
+        }
+        action_check(make_stream(input))
+        assert mock_client.list_objects_v2.call_args[1]['Prefix'] == 'book/m'
+
+    def test_check_configured_prefix_kept_when_longer(self, mocker):
+        response = read_json_file_as_dict('list-objects-v2-full-bucket.json')
+        mock_client = mock_s3_client(mocker, list_response=response)
+        mocker.patch('boto3.client', return_value=mock_client)
+        input = {
+            'source': {
+                'filters': {
+                    'prefix': 'book/m6',
+                    'regexp': r'book/m(?P<version>\d+)/.*'
+                }
+            }
+        }
+        action_check(make_stream(input))
+        assert mock_client.list_objects_v2.call_args[1]['Prefix'] == 'book/m6'
+
+    def test_check_exact_key_uses_head_object(self, mocker):
+        mock_client = mock_s3_client(mocker)
+        mock_client.head_object = mocker.Mock(return_value={
+            'LastModified': '2019-11-21T22:10:17.130Z',
+            'ETag': '"8acbe8269ef193c7d541e56c8ca1e6d0"',
+            'ContentLength': 88
+        })
+        mocker.patch('boto3.client', return_value=mock_client)
+        input = {
+            'source': {
+                'filters': {
+                    'regexp': r'file\.txt$'
+                }
+            }
+        }
+        result = action_check(make_stream(input))
+        assert result == [{'key': 'file.txt'}]
+        mock_client.head_object.assert_called_once_with(Bucket=None, Key='file.txt')
+        mock_client.list_objects_v2.assert_not_called()
+
+    def test_check_exact_key_missing(self, mocker):
+        mock_client = mock_s3_client(mocker)
+        mock_client.head_object = mocker.Mock(side_effect=ClientError(
+            {'Error': {'Code': '404', 'Message': 'Not Found'}}, 'HeadObject'))
+        mocker.patch('boto3.client', return_value=mock_client)
+        input = {
+            'source': {
+                'filters': {
+                    'regexp': r'file\.txt$'
+                }
+            }
+        }
+        assert action_check(make_stream(input)) == []
+
+    def test_check_exact_key_outside_prefix_filter(self, mocker):
+        mock_client = mock_s3_client(mocker)
+        mock_client.head_object = mocker.Mock()
+        mocker.patch('boto3.client', return_value=mock_client)
+        input = {
+            'source': {
+                'filters': {
+                    'prefix': 'foo/',
+                    'regexp': r'bar\.txt$'
+                }
+            }
+        }
+        assert action_check(make_stream(input)) == []
+        mock_client.head_object.assert_not_called()
+        mock_client.list_objects_v2.assert_not_called()
+
+    def test_check_sharded_listing_matches_serial_listing(self, mocker):
+        response = read_json_file_as_dict('list-objects-v2-full-bucket.json')
+        input = {
+            'source': {
+                'filters': {
+                    'regexp': '.*',
+                    'version': 'every'
+                }
+            }
+        }
+        mock_client = mock_s3_client(mocker)
+        mock_client.list_objects_v2.side_effect = fake_list_objects_v2(response['Contents'], page_size=50)
+        mocker.patch('boto3.client', return_value=mock_client)
+        serial_keys = [obj['key'] for obj in action_check(make_stream(input))]
+        assert len(serial_keys) == len(response['Contents'])
+
+        for shards in ['auto', ['book/m4', 'book/m6', 'resources/']]:
+            input['source']['listing'] = {'shards': shards, 'concurrency': 3}
+            sharded_keys = [obj['key'] for obj in action_check(make_stream(input))]
+            assert sorted(sharded_keys) == sorted(serial_keys)
+
+    def test_check_sharded_listing_resumes_after_cursor(self, mocker):
+        response = read_json_file_as_dict('list-objects-v2-full-bucket.json')
+        mock_client = mock_s3_client(mocker)
+        mock_client.list_objects_v2.side_effect = fake_list_objects_v2(response['Contents'], page_size=50)
+        mocker.patch('boto3.client', return_value=mock_client)
+        input = {
+            'source': {
+                'filters': {
+                    'regexp': r'book/m(?P<version>\d+)/.*',
+                    'version': 'every',
+                    'incremental': 'lexical'
+                },
+                'listing': {
+                    'shards': ['book/m4', 'book/m6']
+                }
+            },
+            'version': {
+                'key': 'book/m63000/index.cnxml'
+            }
+        }
+        result = action_check(make_stream(input))
+        assert len(result) == 14
+        assert all(call[1].get('StartAfter', '') >= 'book/m63000/index.cnxml'
+                   for call in mock_client.list_objects_v2.call_args_list)
+
+    def test_check_auto_shards_resume_inside_a_common_prefix(self, mocker):
+        keys = ['builds/1/a.zip', 'builds/2/a.zip', 'builds/2/b.zip', 'builds/3/a.zip']
+        contents = [{'Key': key} for key in keys]
+        mock_client = mock_s3_client(mocker)
+        mock_client.list_objects_v2.side_effect = fake_list_objects_v2(contents)
+        mocker.patch('boto3.client', return_value=mock_client)
+        input = {
+            'source': {
+                'filters': {
+                    'regexp': r'builds/(?P<version>\d+)/(\w+)\.zip',
+                    'version': 'every',
+                    'incremental': 'lexical'
+                },
+                'listing': {
+                    'shards': 'auto'
+                }
+            },
+            'version': {
+                'key': 'builds/2/a.zip'
+            }
+        }
+        assert action_check(make_stream(input)) == [{'key': key} for key in keys[1:]]
+
+    def test_check_invalid_shards(self, mocker):
+        mocker.patch('boto3.client', return_value=mock_s3_client(mocker))
+        input = {
+            'source': {
+                'listing': {
+                    'shards': 'sometimes'
+                }
+            }
+        }
+        with pytest.raises(ValueError):
+            action_check(make_stream(input))
+
+    def test_check_keep_returns_newest_in_chronological_order(self, mocker):
+        response = read_json_file_as_dict('list-objects-v2-full-bucket.json')
+        mock_client = mock_s3_client(mocker, list_response=response)
+        mocker.patch('boto3.client', return_value=mock_client)
+        input = {
+            'source': {
+                'filters': {
+                    'regexp': r'book/m(?P<version>\d+)/index\.cnxml',
+                    'version': 'latest',
+                    'keep': 3
+                }
+            }
+        }
+        result = action_check(make_stream(input))
+        assert len(result) == 3
+        versions = [int(obj['key'].split('/')[1][1:]) for obj in result]
+        assert versions == sorted(versions)
+        assert versions[-1] == 63248
+
+    def test_check_every_sorted_by_version(self, mocker):
+        response = {
+            'Contents': [
+                {'Key': 'builds/1.10.0/book.zip', 'LastModified': '2019-11-22T06:04:34.232Z'},
+                {'Key': 'builds/1.9.0/book.zip', 'LastModified': '2019-11-21T06:04:34.232Z'},
+                {'Key': 'builds/1.9.1/book.zip', 'LastModified': '2019-11-21T07:04:34.232Z'}
+            ]
+        }
+        mock_client = mock_s3_client(mocker, list_response=response)
+        mocker.patch('boto3.client', return_value=mock_client)
+        input = {
+            'source': {
+                'filters': {
+                    'regexp': r'builds/(\d+\.\d+\.\d+)/book\.zip',
+                    'version': 'every'
+                }
+            }
+        }
+        result = action_check(make_stream(input))
+        assert result == [{'key': 'builds/1.9.0/book.zip'},
+                          {'key': 'builds/1.9.1/book.zip'},
+                          {'key': 'builds/1.10.0/book.zip'}]
+
+    def test_check_listing_cache_revalidates_after_last_key(self, mocker, tmp_path):
+        response = read_json_file_as_dict('list-objects-v2-full-bucket.json')
+        contents = response['Contents']
+        mock_client = mock_s3_client(mocker)
+        mock_client.list_objects_v2.side_effect = fake_list_objects_v2(contents[:-1], page_size=200)
+        mocker.patch('boto3.client', return_value=mock_client)
+        input = {
+            'source': {
+                'state_dir': str(tmp_path),
+                'cache': {
+                    'ttl': 600
+                },
+                'filters': {
+                    'regexp': r'.*',
+                    'version': 'every'
+                }
+            }
+        }
+        assert len(action_check(make_stream(input))) == len(contents) - 1
+        assert 'StartAfter' not in mock_client.list_objects_v2.call_args_list[0][1]
+
+        mock_client.list_objects_v2.reset_mock()
+        mock_client.list_objects_v2.side_effect = fake_list_objects_v2(contents, page_size=200)
+        assert len(action_check(make_stream(input))) == len(contents)
+        mock_client.list_objects_v2.assert_called_once_with(
+            Bucket=None, Prefix='', StartAfter=contents[-2]['Key'])
+
+    def test_check_listing_cache_keeps_keys_before_a_lexical_cursor(self, mocker, tmp_path):
+        contents = [{'Key': f'k/{number:03d}'} for number in range(10)]
+        mock_client = mock_s3_client(mocker)
+        mock_client.list_objects_v2.side_effect = fake_list_objects_v2(contents[:5])
+        mocker.patch('boto3.client', return_value=mock_client)
+        input = {
+            'source': {
+                'state_dir': str(tmp_path),
+                'cache': {
+                    'ttl': 600
+                },
+                'filters': {
+                    'regexp': r'k/(\d+)',
+                    'version': 'every'
+                }
+            }
+        }
+        assert len(action_check(make_stream(input))) == 5
+
+        mock_client.list_objects_v2.side_effect = fake_list_objects_v2(contents)
+        lexical_input = json.loads(json.dumps(input))
+        lexical_input['source']['filters']['incremental'] = 'lexical'
+        lexical_input['version'] = {'key': 'k/008'}
+        assert action_check(make_stream(lexical_input)) == [{'key': 'k/008'}, {'key': 'k/009'}]
+        assert action_check(make_stream(input)) == [{'key': obj['Key']} for obj in contents]
+
+    def test_check_index_mode_reads_one_object(self, mocker, tmp_path):
+        mock_client = mock_s3_client(mocker)
+        index_store = FakeIndexStore()
+        index_store.body = json.dumps({'format': 1, 'objects': [
+            {'key': 'builds/1.9.0/book.zip', 'version': [1, 9, 0], 'etag': '"a"', 'size': 1, 'mtime': 1.0},
+            {'key': 'builds/1.10.0/book.zip', 'version': [1, 10, 0], 'etag': '"b"', 'size': 1, 'mtime': 2.0}
+        ]}).encode()
+        index_store.etag = '"index-1"'
+        mock_client.get_object = mocker.Mock(side_effect=index_store.get_object)
+        mocker.patch('boto3.client', return_value=mock_client)
+        input = {
+            'source': {
+                'state_dir': str(tmp_path),
+                'index': {
+                    'key': 'builds/index.json'
+                },
+                'filters': {
+                    'regexp': r'builds/(\d+\.\d+\.\d+)/book\.zip'
+                }
+            }
+        }
+        assert action_check(make_stream(input)) == [{'key': 'builds/1.10.0/book.zip'}]
+        assert 'IfNoneMatch' not in mock_client.get_object.call_args[1]
+
+        assert action_check(make_stream(input)) == [{'key': 'builds/1.10.0/book.zip'}]
+        assert mock_client.get_object.call_args[1]['IfNoneMatch'] == '"index-1"'
+        mock_client.list_objects_v2.assert_not_called()
@@ -0,0 +1,73 @@
+import base64
+import hashlib
+import io
+
+import pytest
+
+from src import checksums
+
+MiB = 1024 * 1024
+
+
+class TestChecksums:
+    def test_single_part_etag(self):
+        digest = checksums.StreamDigest('md5', part_size=5 * MiB, multipart_threshold=8 * MiB)
+        digest.update(b'hello ')
+        digest.update(b'world')
+        assert digest.etag() == f'"{hashlib.md5(b"hello world").hexdigest()}"'
+
+    def test_multipart_etag_matches_s3_layout(self):
+        data = bytes(range(256)) * (47 * 1024)
+        digest = checksums.StreamDigest('md5', part_size=5 * MiB, multipart_threshold=8 * MiB)
+        for start in range(0, len(data), 777777):
+            digest.update(data[start:start + 777777])
+        parts = [data[start:start + 5 * MiB] for start in range(0, len(data), 5 * MiB)]
+        expected = hashlib.md5(b''.join(hashlib.md5(part).digest() for part in parts)).hexdigest()
+        assert digest.etag() == f'"{expected}-{len(parts)}"'
+
+    def test_part_size_clamped_like_s3transfer(self):
+        assert checksums.StreamDigest('md5', part_size=1024, multipart_threshold=1).part_size == 5 * MiB
+
+    def test_hashing_reader_is_not_seekable(self):
+        digest = checksums.StreamDigest('sha256')
+        reader = checksums.HashingReader(io.BytesIO(b'abc'), digest)
+        assert not hasattr(reader, 'seek')
+        assert reader.read(2) + reader.read() == b'abc'
+        assert digest.s3_checksum() == base64.b64encode(hashlib.sha256(b'abc').digest()).decode()
+
+    def test_verify_digest_mismatch(self):
+        digest = checksums.StreamDigest('sha256')
+        digest.update(b'abc')
+        with pytest.raises(checksums.IntegrityError, match='file.txt'):
+            checksums.verify_digest('file.txt', digest, {'ChecksumSHA256': 'bm9wZQ=='})
+
+    def test_verify_digest_skips_composite_and_multipart(self):
+        digest = checksums.StreamDigest('sha256')
+        assert checksums.verify_digest('file.txt', digest, {'ChecksumSHA256': 'abc=-3'}) is False
+        digest = checksums.StreamDigest('md5')
+        assert checksums.verify_digest('file.txt', digest, {'ETag': '"abc-3"'}) is False
+
+    def test_verify_digest_skips_md5_of_kms_and_customer_key_objects(self):
+        digest = checksums.StreamDigest('md5')
+        digest.update(b'abc')
+        assert checksums.verify_digest('file.txt', digest, {
+            'ETag': '"0123456789abcdef0123456789abcdef"', 'ServerSideEncryption': 'aws:kms'}) is False
+        assert checksums.verify_digest('file.txt', digest, {
+            'ETag': '"0123456789abcdef0123456789abcdef"', 'SSECustomerAlgorithm': 'AES256'}) is False
+        assert checksums.verify_digest('file.txt', digest, {
+            'ETag': f'"{hashlib.md5(b"abc").hexdigest()}"', 'ServerSideEncryption': 'AES256'})
+
+    def test_crc32c(self):
+        pytest.importorskip('crc32c')
+        digest = checksums.StreamDigest('crc32c')
+        digest.update(b'123456789')
+        expected = base64.b64encode(bytes.fromhex('e3069283')).decode()
+        assert checksums.verify_digest('file.txt', digest, {'ChecksumCRC32C': expected})
+
+    def test_file_etag(self, tmp_path):
+        path = tmp_path / 'file.bin'
+        data = b'x' * (6 * MiB)
+        path.write_bytes(data)
+        assert checksums.file_etag(path) == f'"{hashlib.md5(data).hexdigest()}"'
+        parts = [hashlib.md5(data[:5 * MiB]).digest(), hashlib.md5(data[5 * MiB:]).digest()]
+        assert checksums.file_etag(path, 5 * MiB) == f'"{hashlib.md5(b"".join(parts)).hexdigest()}-2"'
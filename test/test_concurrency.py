@@ -0,0 +1,75 @@
+import threading
+import time
+
+from src.concurrency import ConcurrencyGovernor
+
+
+class TestConcurrencyGovernor:
+    def test_slots_bound_in_flight_work(self):
+        governor = ConcurrencyGovernor(2)
+        lock = threading.Lock()
+        in_flight = []
+        peak = []
+
+        def work():
+            with governor.slot():
+                with lock:
+                    in_flight.append(1)
+                    peak.append(len(in_flight))
+                time.sleep(0.01)
+                with lock:
+                    in_flight.pop()
+
+        threads = [threading.Thread(target=work) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert max(peak) == 2
+
+    def test_throttle_halves_once_per_round_trip(self, mocker):
+        clock = mocker.patch('time.perf_counter', return_value=100.0)
+        governor = ConcurrencyGovernor(16)
+        governor.record_success('GetObject', 1.0)
+        governor.back_off()
+        governor.back_off()
+        assert governor.limit == 8
+        assert governor.throttles == 2
+        clock.return_value = 101.5
+        governor.back_off()
+        assert governor.limit == 4
+        assert governor.lowest_limit == 4
+
+    def test_backoff_never_drops_below_one_slot(self, mocker):
+        clock = mocker.patch('time.perf_counter', return_value=0.0)
+        governor = ConcurrencyGovernor(4)
+        for attempt in range(10):
+            clock.return_value = attempt
+            governor.back_off()
+        assert governor.limit == 1
+        with governor.slot():
+            pass
+
+    def test_healthy_calls_increase_additively_up_to_max(self):
+        governor = ConcurrencyGovernor(4)
+        governor.limit = 2.0
+        governor.record_success('ListObjectsV2', 0.1)
+        assert governor.limit == 2.5
+        for _ in range(20):
+            governor.record_success('ListObjectsV2', 0.1)
+        assert governor.limit == 4
+
+    def test_slow_calls_hold_the_limit(self):
+        governor = ConcurrencyGovernor(4)
+        governor.limit = 2.0
+        governor.record_success('PutObject', 0.1)
+        governor.record_success('PutObject', 1.0)
+        assert governor.limit == 2.5
+
+    def test_metadata(self):
+        governor = ConcurrencyGovernor(8)
+        assert governor.metadata() == [
+            {'name': 'concurrency_limit', 'value': '8'},
+            {'name': 'concurrency_lowest_limit', 'value': '8'},
+            {'name': 'throttles', 'value': '0'},
+        ]
@@ -0,0 +1,113 @@
+import io
+import json
+
+import pytest
+
+from bench import end_to_end
+from bench.fake_s3 import FakeBucket, FakeS3Server, pattern_chunks
+from src.action_check import action_check
+from src.action_in import action_in
+from src.action_out import action_out
+from src.resource_boto_client import ResourceBotoClient
+
+
+@pytest.fixture
+def fake_s3():
+    bucket = FakeBucket('bench')
+    with FakeS3Server(bucket) as server:
+        yield bucket, server
+
+
+def client_for(server, **params):
+    return ResourceBotoClient({'source': end_to_end.source(server.endpoint), 'params': params})
+
+
+def make_stream(input):
+    return io.StringIO(json.dumps(input))
+
+
+class TestFakeS3:
+    def test_paginated_listing_with_delimiter(self, fake_s3):
+        bucket, server = fake_s3
+        bucket.add_synthetic([f'a/{number:04d}' for number in range(2500)] + ['b/1/x', 'b/2/x', 'b/3'], 10)
+        client = client_for(server).client
+        paginator = client.get_paginator('list_objects_v2')
+        keys = [entry['Key'] for page in paginator.paginate(Bucket='bench', Prefix='a/', StartAfter='a/0100')
+                for entry in page.get('Contents', [])]
+        assert keys == [f'a/{number:04d}' for number in range(101, 2500)]
+        page = client.list_objects_v2(Bucket='bench', Prefix='b/', Delimiter='/')
+        assert [entry['Prefix'] for entry in page['CommonPrefixes']] == ['b/1/', 'b/2/']
+        assert [entry['Key'] for entry in page['Contents']] == ['b/3']
+
+    def test_ranged_download_streams_real_bodies(self, fake_s3, tmp_path):
+        bucket, server = fake_s3
+        bucket.add_synthetic(['large.bin'], 300000)
+        input = {
+            'source': end_to_end.source(server.endpoint),
+            'version': {'key': 'large.bin'},
+            'params': {'mode': 'single', 'range_size': 65536}
+        }
+        action_in(str(tmp_path), make_stream(input))
+        assert (tmp_path / 'large.bin').read_bytes() == b''.join(pattern_chunks(0, 300000))
+
+    def test_verified_multipart_upload(self, fake_s3, tmp_path):
+        bucket, server = fake_s3
+        (tmp_path / 'big.bin').write_bytes(b'\x01' * (9 * 1024 * 1024))
+        input = {
+            'source': end_to_end.source(server.endpoint),
+            'params': {'glob': '*.bin', 'verify': 'md5'}
+        }
+        action_out(str(tmp_path), make_stream(input))
+        assert bucket.sizes['big.bin'] == 9 * 1024 * 1024
+        assert bucket.etag('big.bin').endswith('-2"')
+        assert bucket.counters()['requests']['UploadPart'] == 2
+
+    def test_end_to_end_report(self, tmp_path):
+        output = tmp_path / 'report.json'
+        report = end_to_end.main(['--keys', '1200', '--objects', '5', '--large-size', '1MiB',
+                                  '--range-size', '256KiB', '--repeat', '1', '--output', str(output)])
+        assert json.loads(output.read_text()) == report
+        assert set(report['scenarios']) == {'check', 'check_auto_shards', 'in_all', 'in_single',
+                                            'in_single_ranged', 'out_small_files', 'out_large_file'}
+        assert report['scenarios']['check']['requests'] == {'ListObjectsV2': 2}
+        assert report['scenarios']['in_single_ranged']['bytes_sent'] == 1024 * 1024
+
+    def test_metrics_count_throttled_retries(self, fake_s3, tmp_path):
+        bucket, server = fake_s3
+        bucket.add_synthetic([f'releases/book-1.{number}.0.zip' for number in range(1500)], 10)
+        bucket.throttle(2)
+        metrics_file = tmp_path / 'metrics.json'
+        input = {
+            'source': end_to_end.source(server.endpoint,
+                                        filters={'regexp': r'releases/book-(.*)\.zip'},
+                                        service={'bucket': 'bench', 'endpoint': server.endpoint,
+                                                 'region': 'us-east-1', 'retry_mode': 'standard',
+                                                 'max_attempts': 5},
+                                        metrics={'file': str(metrics_file)})
+        }
+        assert action_check(make_stream(input)) == [{'key': 'releases/book-1.1499.0.zip'}]
+        summary = json.loads(metrics_file.read_text())['metrics']
+        listing = summary['operations']['ListObjectsV2']
+        assert listing['calls'] == 2
+        assert listing['retries'] == 2
+        assert listing['throttles'] == 2
+        assert summary['throttles'] == 2
+        assert set(summary['phases']) == {'list', 'filter'}
+
+    def test_throttling_shrinks_the_concurrency_limit(self, fake_s3, tmp_path):
+        bucket, server = fake_s3
+        for number in range(20):
+            (tmp_path / f'{number}.txt').write_bytes(b'page')
+        bucket.throttle(4)
+        input = {
+            'source': end_to_end.source(server.endpoint,
+                                        service={'bucket': 'bench', 'endpoint': server.endpoint,
+                                                 'region': 'us-east-1', 'retry_mode': 'standard',
+                                                 'max_attempts': 10}),
+            'params': {'glob': '*.txt', 'concurrency': 8}
+        }
+        metadata = {entry['name']: int(entry['value'])
+                    for entry in action_out(str(tmp_path), make_stream(input))['metadata']}
+        assert metadata['throttles'] == 4
+        assert metadata['concurrency_lowest_limit'] < 8
+        assert len([key for key in bucket.sizes if key.endswith('.txt')]) == 20
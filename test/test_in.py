@@ -1,12 +1,21 @@
+import hashlib
+import io
+import json
+import tarfile
+import threading
 from pathlib import Path
 
 import pytest
 
 from src.action_in import action_in
+from src.checksums import IntegrityError
 
 from .helpers import (read_json_file_as_dict,
                       make_stream,
-                      mock_s3_client)
+                      mock_s3_client,
+                      fake_object_store,
+                      fake_list_objects_v2,
+                      FakeObjectBody)
 
 
 DIR_NO_EXIST = '_tmp-delete-me'
@@ -271,3 +280,305 @@ class TestIn:
             Bucket=None,
             Key='book/m63248/index.cnxml',
             Filename=f'{DIR_NO_EXIST}/book/m63248/index.cnxml')
+
+    def test_in_download_failures_reported_after_sync(self, mocker):
+        response = read_json_file_as_dict('list-objects-v2-full-bucket.json')
+        mock_client = mock_s3_client(mocker, list_response=response)
+
+        def download_file(*, Bucket, Key, Filename):
+            if Key == 'book/m63248/index.cnxml':
+                raise OSError('disk full')
+
+        mock_client.download_file.side_effect = download_file
+        mocker.patch('boto3.client', return_value=mock_client)
+        mocker.patch.object(Path, 'mkdir')
+        input = {
+            'source': {
+                'filters': {
+                    'regexp': r'book/m(?P<version>\d+)/index[.].*',
+                    'version': 'every'
+                }
+            },
+            'params': {
+                'mode': 'all',
+                'concurrency': 4
+            }
+        }
+        with pytest.raises(RuntimeError, match='book/m63248/index.cnxml'):
+            action_in(DIR_NO_EXIST, make_stream(input))
+        assert mock_client.download_file.call_count == 159
+
+    def test_in_invalid_concurrency(self, mocker):
+        mocker.patch('boto3.client', return_value=mock_s3_client(mocker))
+        input = {
+            'params': {
+                'mode': 'all',
+                'concurrency': -2
+            }
+        }
+        with pytest.raises(ValueError):
+            action_in(DIR_NO_EXIST, make_stream(input))
+
+    def test_in_manifest_downloads_only_new_or_changed(self, mocker, tmp_path):
+        response = read_json_file_as_dict('list-objects-v2-minio-multiple-match.json')
+        mock_client = mock_s3_client(mocker, list_response=response)
+        mocker.patch('boto3.client', return_value=mock_client)
+        input = {
+            'source': {
+                'filters': {
+                    'regexp': r'file.te?xt',
+                    'version': 'every'
+                }
+            },
+            'params': {
+                'mode': 'all',
+                'manifest': '.s3-manifest.json'
+            }
+        }
+        action_in(str(tmp_path), make_stream(input))
+        assert mock_client.download_file.call_count == 2
+
+        (tmp_path / 'file.text').write_text('downloaded')
+        (tmp_path / 'file.txt').write_text('downloaded')
+        response['Contents'][1]['ETag'] = '"changed"'
+        mock_client.download_file.reset_mock()
+        action_in(str(tmp_path), make_stream(input))
+        mock_client.download_file.assert_called_once_with(
+            Bucket=None,
+            Key='file.txt',
+            Filename=str(tmp_path / 'file.txt'))
+
+    def test_in_manifest_ignores_listing_cache(self, mocker, tmp_path):
+        response = read_json_file_as_dict('list-objects-v2-minio-multiple-match.json')
+        mock_client = mock_s3_client(mocker, list_response=response)
+        mocker.patch('boto3.client', return_value=mock_client)
+        destination = tmp_path / 'destination'
+        input = {
+            'source': {
+                'state_dir': str(tmp_path / 'state'),
+                'cache': {
+                    'ttl': 600
+                },
+                'filters': {
+                    'regexp': r'file.te?xt',
+                    'version': 'every'
+                }
+            },
+            'params': {
+                'mode': 'all',
+                'manifest': '.s3-manifest.json'
+            }
+        }
+        action_in(str(destination), make_stream(input))
+        assert mock_client.download_file.call_count == 2
+
+        (destination / 'file.text').write_text('downloaded')
+        (destination / 'file.txt').write_text('downloaded')
+        response['Contents'][1]['ETag'] = '"changed"'
+        mock_client.download_file.reset_mock()
+        action_in(str(destination), make_stream(input))
+        assert 'StartAfter' not in mock_client.list_objects_v2.call_args[1]
+        mock_client.download_file.assert_called_once_with(
+            Bucket=None,
+            Key='file.txt',
+            Filename=str(destination / 'file.txt'))
+
+    def test_in_without_manifest_skips_existing_files(self, mocker, tmp_path):
+        response = read_json_file_as_dict('list-objects-v2-minio-multiple-match.json')
+        mock_client = mock_s3_client(mocker, list_response=response)
+        mocker.patch('boto3.client', return_value=mock_client)
+        (tmp_path / 'file.txt').write_text('already here')
+        input = {
+            'source': {
+                'filters': {
+                    'regexp': r'file.te?xt',
+                    'version': 'every'
+                }
+            },
+            'params': {
+                'mode': 'all'
+            }
+        }
+        action_in(str(tmp_path), make_stream(input))
+        mock_client.download_file.assert_called_once_with(
+            Bucket=None,
+            Key='file.text',
+            Filename=str(tmp_path / 'file.text'))
+
+    def test_in_single_ranged_download(self, mocker, tmp_path):
+        data = bytes(range(256)) * 41
+        mock_client = fake_object_store(mocker, mock_s3_client(mocker), {'archive.tar': data})
+        mocker.patch('boto3.client', return_value=mock_client)
+        input = {
+            'version': {
+                'key': 'archive.tar'
+            },
+            'params': {
+                'mode': 'single',
+                'range_size': 1000,
+                'concurrency': 4
+            }
+        }
+        action_in(str(tmp_path), make_stream(input))
+        assert (tmp_path / 'archive.tar').read_bytes() == data
+        assert mock_client.get_object.call_count == 11
+        mock_client.download_file.assert_not_called()
+        assert {call[1]['IfMatch'] for call in mock_client.get_object.call_args_list} == {
+            f'"etag-{len(data)}"'}
+
+    def test_in_single_ranged_download_resumes(self, mocker, tmp_path):
+        data = bytes(range(256)) * 40
+        mock_client = fake_object_store(mocker, mock_s3_client(mocker), {'archive.tar': data})
+        get_object = mock_client.get_object.side_effect
+
+        def interrupted_get_object(**kwargs):
+            if kwargs['Range'].startswith('bytes=5000-'):
+                raise ConnectionError('preempted')
+            return get_object(**kwargs)
+
+        mock_client.get_object.side_effect = interrupted_get_object
+        mocker.patch('boto3.client', return_value=mock_client)
+        input = {
+            'version': {
+                'key': 'archive.tar'
+            },
+            'params': {
+                'mode': 'single',
+                'range_size': 1000,
+                'concurrency': 1
+            }
+        }
+        with pytest.raises(ConnectionError):
+            action_in(str(tmp_path), make_stream(input))
+        assert not (tmp_path / 'archive.tar').exists()
+        assert (tmp_path / 'archive.tar.part').exists()
+        completed = json.loads((tmp_path / 'archive.tar.part.json').read_text())['completed']
+        assert 0 < len(completed) < 11
+
+        mock_client.get_object.reset_mock()
+        mock_client.get_object.side_effect = get_object
+        action_in(str(tmp_path), make_stream(input))
+        assert (tmp_path / 'archive.tar').read_bytes() == data
+        fetched_starts = {int(call[1]['Range'][len('bytes='):].split('-')[0])
+                          for call in mock_client.get_object.call_args_list}
+        assert fetched_starts == set(range(0, len(data), 1000)) - set(completed)
+        assert sorted(path.name for path in tmp_path.iterdir()) == ['archive.tar']
+
+    def test_in_verified_download(self, mocker, tmp_path):
+        data = b'some book contents' * 1000
+        mock_client = mock_s3_client(mocker)
+        mock_client.get_object = mocker.Mock(side_effect=lambda **kwargs: {
+            'Body': FakeObjectBody(data),
+            'ETag': '"bad"' if kwargs['Key'] == 'corrupt.txt' else f'"{hashlib.md5(data).hexdigest()}"'
+        })
+        mocker.patch('boto3.client', return_value=mock_client)
+        input = {
+            'version': {
+                'key': 'book.txt'
+            },
+            'params': {
+                'mode': 'single',
+                'verify': 'md5'
+            }
+        }
+        action_in(str(tmp_path), make_stream(input))
+        assert (tmp_path / 'book.txt').read_bytes() == data
+        assert mock_client.get_object.call_args[1]['ChecksumMode'] == 'ENABLED'
+        mock_client.download_file.assert_not_called()
+
+        input['version']['key'] = 'corrupt.txt'
+        with pytest.raises(IntegrityError, match='corrupt.txt'):
+            action_in(str(tmp_path), make_stream(input))
+        assert not (tmp_path / 'corrupt.txt').exists()
+        assert not (tmp_path / 'corrupt.txt.part').exists()
+
+    def test_in_verified_download_never_leaves_a_partial_file(self, mocker, tmp_path):
+        class ResetBody(FakeObjectBody):
+            def iter_chunks(self, chunk_size=1024):
+                yield b'abc'
+                raise ConnectionResetError('connection reset by peer')
+
+        mock_client = mock_s3_client(mocker)
+        mock_client.get_object = mocker.Mock(return_value={'Body': ResetBody(b''), 'ETag': '"abc"'})
+        mocker.patch('boto3.client', return_value=mock_client)
+        input = {
+            'version': {
+                'key': 'book.txt'
+            },
+            'params': {
+                'mode': 'single',
+                'verify': 'md5'
+            }
+        }
+        with pytest.raises(ConnectionResetError):
+            action_in(str(tmp_path), make_stream(input))
+        assert list(tmp_path.iterdir()) == []
+
+    def test_in_verify_rejects_ranged_download(self, mocker):
+        mocker.patch('boto3.client', return_value=mock_s3_client(mocker))
+        input = {
+            'params': {
+                'mode': 'single',
+                'verify': 'sha256',
+                'range_size': 1024
+            }
+        }
+        with pytest.raises(ValueError):
+            action_in(DIR_NO_EXIST, make_stream(input))
+
+    def test_in_archive_extracts_while_streaming(self, mocker, tmp_path):
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w:xz') as packed:
+            info = tarfile.TarInfo('book/page.html')
+            info.size = 7
+            packed.addfile(info, io.BytesIO(b'<html/>'))
+        mock_client = mock_s3_client(mocker)
+        mock_client.get_object = mocker.Mock(return_value={'Body': FakeObjectBody(buffer.getvalue())})
+        mocker.patch('boto3.client', return_value=mock_client)
+        input = {
+            'version': {
+                'key': 'book-1.0.0.tar.xz'
+            },
+            'params': {
+                'mode': 'archive',
+                'compression': 'xz'
+            }
+        }
+        assert action_in(str(tmp_path), make_stream(input))['version'] == {'key': 'book-1.0.0.tar.xz'}
+        mock_client.get_object.assert_called_once_with(Bucket=None, Key='book-1.0.0.tar.xz')
+        assert (tmp_path / 'book' / 'page.html').read_bytes() == b'<html/>'
+        mock_client.download_file.assert_not_called()
+
+    def test_in_all_downloads_while_listing(self, mocker, tmp_path):
+        contents = [{'Key': f'book/{29 - number:03d}/page-1.{number}.0.html', 'Size': 4}
+                    for number in range(30)]
+        list_page = fake_list_objects_v2(contents, page_size=10)
+        first_download = threading.Event()
+
+        def list_objects_v2(**kwargs):
+            if 'ContinuationToken' in kwargs:
+                # Only an overlapped pipeline has downloaded anything before page two
+                assert first_download.wait(timeout=5)
+            return list_page(**kwargs)
+
+        mock_client = mock_s3_client(mocker)
+        mock_client.list_objects_v2.side_effect = list_objects_v2
+        mock_client.download_file.side_effect = lambda **kwargs: first_download.set()
+        mocker.patch('boto3.client', return_value=mock_client)
+        input = {
+            'source': {
+                'filters': {
+                    'regexp': r'book/.*/page-(.*)\.html',
+                    'version': '1.5.0'
+                }
+            },
+            'params': {
+                'mode': 'all',
+                'concurrency': 2
+            }
+        }
+        result = action_in(str(tmp_path), make_stream(input))
+        assert mock_client.download_file.call_count == 25
+        assert mock_client.list_objects_v2.call_count == 3
+        # The reported version is the newest one, which is listed first here
+        assert result['version'] == {'key': 'book/000/page-1.29.0.html'}
@@ -0,0 +1,27 @@
+import pytest
+
+from src import index_object
+
+
+class TestIndexObject:
+    def test_merge_replaces_entries_with_same_key(self):
+        document = {'format': 1, 'objects': [
+            {'key': 'b', 'version': [2], 'etag': '"old"', 'size': 1, 'mtime': 1.0},
+            {'key': 'a', 'version': [1], 'etag': '"a"', 'size': 1, 'mtime': 1.0}
+        ]}
+        new_entry = {'key': 'b', 'version': [2], 'etag': '"new"', 'size': 2, 'mtime': 2.0}
+        merged = index_object.merge_index(document, [new_entry])
+        assert [entry['key'] for entry in merged['objects']] == ['a', 'b']
+        assert merged['objects'][1] == new_entry
+
+    def test_round_trip(self):
+        response_object = {'Key': 'a', 'LastModified': '2019-11-21T22:10:17.130Z', 'Size': 88, 'ETag': '"e"'}
+        entry = index_object.index_entry(response_object, (1, 0))
+        document = index_object.merge_index(index_object.empty_index(), [entry])
+        parsed = index_object.parse_index(index_object.serialize_index(document))
+        assert index_object.response_object_from_index_entry(parsed['objects'][0]) == {
+            'Key': 'a', 'LastModified': entry['mtime'], 'Size': 88, 'ETag': '"e"'}
+
+    def test_parse_rejects_non_index(self):
+        with pytest.raises(ValueError):
+            index_object.parse_index(b'[]')
@@ -0,0 +1,42 @@
+import os
+import time
+
+from src.listing_cache import ListingCache, cache_entry, response_object_from_entry
+
+
+class TestListingCache:
+    def test_round_trip(self, tmp_path):
+        cache = ListingCache(tmp_path, 60, 1024 * 1024, 'endpoint', 'bucket', 'prefix/')
+        assert cache.load() is None
+        entry = cache_entry({'Key': 'prefix/a', 'LastModified': '2019-11-21T22:10:17.130Z',
+                             'Size': 88, 'ETag': '"etag"', 'StorageClass': 'STANDARD'})
+        assert cache.store(time.time(), 'prefix/a', [entry]) is True
+        _, last_key, entries = cache.load()
+        assert last_key == 'prefix/a'
+        assert entries == [entry]
+
+    def test_expired_listing_ignored(self, tmp_path, mocker):
+        cache = ListingCache(tmp_path, 60, 1024 * 1024, 'bucket')
+        mocker.patch('time.time', return_value=1000.0)
+        cache.store(1000.0, 'a', [['a', 0.0, 1, '"etag"']])
+        assert cache.load() == (1000.0, 'a', [['a', 0.0, 1, '"etag"']])
+        mocker.patch('time.time', return_value=1061.0)
+        assert cache.load() is None
+
+    def test_oversized_listing_not_stored(self, tmp_path):
+        cache = ListingCache(tmp_path, 60, 10, 'bucket')
+        assert cache.store(0.0, 'a', [['a', 0.0, 1, '"etag"']]) is False
+        assert not cache.path.exists()
+
+    def test_least_recently_used_evicted(self, tmp_path):
+        old_cache = ListingCache(tmp_path, 60, 100, 'old')
+        new_cache = ListingCache(tmp_path, 60, 100, 'new')
+        old_cache.store(0.0, 'a', [['a', 0.0, 1, '"etag"']])
+        os.utime(old_cache.path, (0, 0))
+        new_cache.store(0.0, 'b', [['b', 0.0, 1, '"etag"']])
+        assert new_cache.path.exists()
+        assert not old_cache.path.exists()
+
+    def test_entry_round_trip(self):
+        response_object = {'Key': 'a', 'LastModified': 1574374217.13, 'Size': 88, 'ETag': '"etag"'}
+        assert response_object_from_entry(cache_entry(response_object)) == response_object
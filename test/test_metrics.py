@@ -0,0 +1,54 @@
+import json
+from contextlib import redirect_stderr
+from io import StringIO
+
+import pytest
+
+from src.metrics import Metrics, is_throttle
+
+
+class TestMetrics:
+    def test_timed_iter_splits_producer_and_consumer_time(self, mocker):
+        clock = iter(range(100))
+        mocker.patch('time.perf_counter', side_effect=lambda: next(clock))
+        metrics = Metrics()
+        for _ in metrics.timed_iter(['a', 'b'], 'list', 'filter'):
+            next(clock)
+        # Each next() spans one tick, each loop body two (its own tick plus the yield's)
+        assert metrics.phases['list'] == {'count': 1, 'seconds': 3, 'bytes': 0}
+        assert metrics.phases['filter'] == {'count': 1, 'seconds': 4, 'bytes': 0}
+
+    def test_phase_records_bytes_on_failure(self):
+        metrics = Metrics()
+        with pytest.raises(OSError):
+            with metrics.phase('download') as span:
+                span['bytes'] = 10
+                raise OSError('disk full')
+        assert metrics.phases['download']['count'] == 1
+        assert metrics.phases['download']['bytes'] == 10
+
+    def test_is_throttle(self):
+        assert is_throttle({'status_code': 503}, {})
+        assert is_throttle({'status_code': 400}, {'Error': {'Code': 'SlowDown'}})
+        assert not is_throttle({'status_code': 404}, {'Error': {'Code': 'NoSuchKey'}})
+        assert not is_throttle(None, None)
+
+    def test_reported_emits_to_stderr(self):
+        metrics = Metrics()
+        stderr_output = StringIO()
+        with redirect_stderr(stderr_output), pytest.raises(RuntimeError):
+            with metrics.reported('in'):
+                raise RuntimeError('failed')
+        summary = json.loads(stderr_output.getvalue())['metrics']
+        assert summary['action'] == 'in'
+        assert summary['operations'] == {}
+
+    def test_reported_emits_to_file(self, tmp_path):
+        output_file = tmp_path / 'metrics' / 'check.json'
+        metrics = Metrics(str(output_file))
+        with metrics.phase('list'):
+            pass
+        metrics.emit('check')
+        summary = json.loads(output_file.read_text())['metrics']
+        assert summary['phases']['list']['count'] == 1
+        assert summary['retries'] == 0
@@ -1,9 +1,18 @@
+import base64
+import hashlib
+import io
+import json
+import tarfile
 from pathlib import Path
 
+import pytest
+
 from src.action_out import action_out
 
 from .helpers import (make_stream,
-                      mock_s3_client)
+                      mock_s3_client,
+                      FakeIndexStore,
+                      fake_list_objects_v2)
 
 
 DIR_NO_EXIST = '_tmp-delete-me'
@@ -45,3 +54,197 @@ class TestOut:
             Bucket=None,
             Key='file.txt',
             Filename=f'{DIR_NO_EXIST}/file.txt')
+
+    def test_uploads_start_before_glob_finishes(self, mocker):
+        mock_client = mock_s3_client(mocker)
+        mocker.patch('boto3.client', return_value=mock_client)
+
+        def glob(path, pattern):
+            for number in range(50):
+                if number >= 10:
+                    assert mock_client.upload_file.call_count > 0
+                yield Path(f'{DIR_NO_EXIST}/file-{number}.txt')
+
+        mocker.patch.object(Path, 'glob', new=glob)
+        mocker.patch.object(Path, 'is_file', new=lambda path: '.' in str(path))
+        input = {
+            'params': {
+                'glob': '**/*.txt',
+                'concurrency': 2
+            }
+        }
+        action_out(DIR_NO_EXIST, make_stream(input))
+        assert mock_client.upload_file.call_count == 50
+
+    def test_upload_failures_reported_after_upload(self, mocker):
+        mock_client = mock_s3_client(mocker)
+        mock_client.upload_file.side_effect = [OSError('gone'), None]
+        mocker.patch('boto3.client', return_value=mock_client)
+        mocker.patch.object(Path, 'glob', return_value=[
+            Path(f'{DIR_NO_EXIST}/a.txt'),
+            Path(f'{DIR_NO_EXIST}/b.txt')])
+        mocker.patch.object(Path, 'is_file', new=lambda path: '.' in str(path))
+        input = {
+            'params': {
+                'concurrency': 1
+            }
+        }
+        with pytest.raises(RuntimeError, match='a.txt'):
+            action_out(DIR_NO_EXIST, make_stream(input))
+        assert mock_client.upload_file.call_count == 2
+
+    def test_index_object_updated_after_upload(self, mocker):
+        mock_client = mock_s3_client(mocker)
+        index_store = FakeIndexStore()
+        mock_client.get_object = mocker.Mock(side_effect=index_store.get_object)
+        mock_client.put_object = mocker.Mock(side_effect=index_store.put_object)
+        mock_client.head_object = mocker.Mock(return_value={
+            'LastModified': '2019-11-21T22:10:17.130Z',
+            'ETag': '"8acbe8269ef193c7d541e56c8ca1e6d0"',
+            'ContentLength': 88
+        })
+        mocker.patch('boto3.client', return_value=mock_client)
+        mocker.patch.object(Path, 'glob', return_value=[
+            Path(f'{DIR_NO_EXIST}/builds/1.0.0/book.zip'),
+            Path(f'{DIR_NO_EXIST}/builds/1.0.0/notes.txt')])
+        mocker.patch.object(Path, 'is_file', new=lambda path: '.' in str(path))
+        input = {
+            'source': {
+                'index': {
+                    'key': 'builds/index.json'
+                },
+                'filters': {
+                    'regexp': r'builds/(\d+\.\d+\.\d+)/book\.zip'
+                }
+            },
+            'params': {
+                'glob': '**/*'
+            }
+        }
+        action_out(DIR_NO_EXIST, make_stream(input))
+        document = json.loads(index_store.body)
+        assert [entry['key'] for entry in document['objects']] == ['builds/1.0.0/book.zip']
+        assert document['objects'][0]['version'] == [1, 0, 0]
+        assert document['objects'][0]['size'] == 88
+        mock_client.put_object.assert_called_once()
+        assert mock_client.put_object.call_args[1]['IfNoneMatch'] == '*'
+
+    def test_index_update_retried_when_precondition_fails(self, mocker):
+        mock_client = mock_s3_client(mocker)
+        index_store = FakeIndexStore()
+        index_store.body = b'{"format": 1, "objects": []}'
+        index_store.etag = '"first"'
+        get_object = index_store.get_object
+        calls = []
+
+        def racing_get_object(**kwargs):
+            response = get_object(**kwargs)
+            if not calls:
+                index_store.etag = '"changed-by-someone-else"'
+            calls.append(kwargs)
+            return response
+
+        mock_client.get_object = mocker.Mock(side_effect=racing_get_object)
+        mock_client.put_object = mocker.Mock(side_effect=index_store.put_object)
+        mock_client.head_object = mocker.Mock(return_value={'ETag': '"etag"', 'ContentLength': 1})
+        mocker.patch('boto3.client', return_value=mock_client)
+        mocker.patch.object(Path, 'glob', return_value=[Path(f'{DIR_NO_EXIST}/file.txt')])
+        mocker.patch.object(Path, 'is_file', new=lambda path: True)
+        input = {
+            'source': {
+                'index': {
+                    'key': 'index.json'
+                }
+            }
+        }
+        action_out(DIR_NO_EXIST, make_stream(input))
+        assert mock_client.put_object.call_count == 2
+        assert [entry['key'] for entry in json.loads(index_store.body)['objects']] == ['file.txt']
+
+    def test_verified_upload(self, mocker, tmp_path):
+        data = b'chapter' * 100
+        (tmp_path / 'file.txt').write_bytes(data)
+        mock_client = mock_s3_client(mocker)
+        uploaded = {}
+
+        def upload_fileobj(fileobj, bucket, key, ExtraArgs):
+            uploaded[key] = b''.join(iter(lambda: fileobj.read(64), b''))
+
+        mock_client.upload_fileobj = mocker.Mock(side_effect=upload_fileobj)
+        mock_client.head_object = mocker.Mock(side_effect=lambda **kwargs: {
+            'ETag': '"whatever"',
+            'ChecksumSHA256': base64.b64encode(hashlib.sha256(uploaded[kwargs['Key']]).digest()).decode()
+        })
+        mocker.patch('boto3.client', return_value=mock_client)
+        input = {
+            'params': {
+                'glob': '*.txt',
+                'verify': 'sha256'
+            }
+        }
+        action_out(str(tmp_path), make_stream(input))
+        assert uploaded == {'file.txt': data}
+        assert mock_client.upload_fileobj.call_args[1]['ExtraArgs'] == {'ChecksumAlgorithm': 'SHA256'}
+        mock_client.upload_file.assert_not_called()
+
+    def test_skip_unchanged_uploads(self, mocker, tmp_path):
+        (tmp_path / 'book').mkdir()
+        (tmp_path / 'book' / 'same.html').write_bytes(b'same')
+        (tmp_path / 'book' / 'edited.html').write_bytes(b'new text')
+        (tmp_path / 'book' / 'resized.html').write_bytes(b'longer than before')
+        (tmp_path / 'book' / 'added.html').write_bytes(b'added')
+        remote = [
+            {'Key': 'book/same.html', 'Size': 4, 'ETag': f'"{hashlib.md5(b"same").hexdigest()}"'},
+            {'Key': 'book/edited.html', 'Size': 8, 'ETag': f'"{hashlib.md5(b"old text").hexdigest()}"'},
+            {'Key': 'book/resized.html', 'Size': 5, 'ETag': '"abc"'}
+        ]
+        mock_client = mock_s3_client(mocker)
+        mock_client.list_objects_v2.side_effect = fake_list_objects_v2(remote)
+        mocker.patch('boto3.client', return_value=mock_client)
+        input = {
+            'params': {
+                'glob': 'book/*.html',
+                'skip_unchanged': True
+            }
+        }
+        action_out(str(tmp_path), make_stream(input))
+        mock_client.list_objects_v2.assert_called_once_with(Bucket=None, Prefix='book/')
+        uploaded_keys = sorted(call[1]['Key'] for call in mock_client.upload_file.call_args_list)
+        assert uploaded_keys == ['book/added.html', 'book/edited.html', 'book/resized.html']
+
+    def test_archive_upload(self, mocker, tmp_path):
+        (tmp_path / 'book').mkdir()
+        (tmp_path / 'book' / 'a.html').write_bytes(b'first')
+        (tmp_path / 'book' / 'b.html').write_bytes(b'second')
+        uploaded = {}
+        mock_client = mock_s3_client(mocker)
+
+        def upload_fileobj(fileobj, bucket, key, **kwargs):
+            uploaded[key] = fileobj.read()
+
+        mock_client.upload_fileobj.side_effect = upload_fileobj
+        mocker.patch('boto3.client', return_value=mock_client)
+        input = {
+            'params': {
+                'glob': 'book/*.html',
+                'archive': 'book-1.0.0.tar.gz',
+                'compression': 'gzip'
+            }
+        }
+        assert action_out(str(tmp_path), make_stream(input))['version'] == {'key': 'book-1.0.0.tar.gz'}
+        mock_client.upload_file.assert_not_called()
+        with tarfile.open(fileobj=io.BytesIO(uploaded['book-1.0.0.tar.gz']), mode='r:gz') as result:
+            assert sorted(result.getnames()) == ['book/a.html', 'book/b.html']
+            assert result.extractfile('book/b.html').read() == b'second'
+
+    def test_archive_invalid_compression(self, mocker):
+        mocker.patch('boto3.client', return_value=mock_s3_client(mocker))
+        input = {
+            'params': {
+                'glob': '*',
+                'archive': 'book.tar',
+                'compression': 'rar'
+            }
+        }
+        with pytest.raises(ValueError):
+            action_out(DIR_NO_EXIST, make_stream(input))
@@ -0,0 +1,58 @@
+import pstats
+
+import pytest
+
+from src.action_check import action_check
+from src.profiling import PROFILE_DIR_ENV, PROFILE_ENV, profiled
+
+from .helpers import make_stream, mock_s3_client, read_json_file_as_dict
+
+
+def check_input(**profile):
+    return {
+        'source': {
+            'filters': {
+                'regexp': '.*',
+                'version': 'every'
+            },
+            'profile': profile
+        }
+    }
+
+
+class TestProfiling:
+    def test_disabled_is_a_no_op(self, mocker, monkeypatch):
+        monkeypatch.delenv(PROFILE_ENV, raising=False)
+        monkeypatch.delenv(PROFILE_DIR_ENV, raising=False)
+        default_state_dir = mocker.patch('src.profiling.default_state_dir')
+        with profiled('check', {}):
+            pass
+        default_state_dir.assert_not_called()
+
+    def test_invalid_kind(self, monkeypatch):
+        monkeypatch.setenv(PROFILE_ENV, 'cpu,disk')
+        with pytest.raises(ValueError):
+            profiled('check', {})
+
+    def test_env_profiles_cpu_and_memory(self, mocker, monkeypatch, tmp_path):
+        monkeypatch.setenv(PROFILE_ENV, 'cpu,memory')
+        monkeypatch.setenv(PROFILE_DIR_ENV, str(tmp_path))
+        response = read_json_file_as_dict('list-objects-v2-full-bucket.json')
+        mocker.patch('boto3.client', return_value=mock_s3_client(mocker, list_response=response))
+        action_check(make_stream(check_input()))
+
+        stats_path, = tmp_path.glob('check-*.pstats')
+        functions = {function for _, _, function in pstats.Stats(str(stats_path)).stats}
+        assert 'list_filtered_objects' in functions
+        memory_report, = tmp_path.glob('check-*-memory.txt')
+        assert memory_report.read_text().startswith('current: ')
+        assert len(list(tmp_path.glob('check-*-cpu.txt'))) == 1
+
+    def test_source_config_profiles_cpu_only(self, mocker, monkeypatch, tmp_path):
+        monkeypatch.delenv(PROFILE_ENV, raising=False)
+        monkeypatch.delenv(PROFILE_DIR_ENV, raising=False)
+        response = read_json_file_as_dict('list-objects-v2-empty.json')
+        mocker.patch('boto3.client', return_value=mock_s3_client(mocker, list_response=response))
+        action_check(make_stream(check_input(kinds=['cpu'], dir=str(tmp_path / 'profiles'))))
+        assert len(list((tmp_path / 'profiles').glob('check-*.pstats'))) == 1
+        assert list((tmp_path / 'profiles').glob('*-memory.txt')) == []
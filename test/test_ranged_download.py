@@ -0,0 +1,8 @@
+from src import ranged_download
+
+
+class TestRangedDownload:
+    def test_byte_ranges_cover_object(self):
+        assert ranged_download.byte_ranges(10, 4) == [(0, 3), (4, 7), (8, 9)]
+        assert ranged_download.byte_ranges(8, 4) == [(0, 3), (4, 7)]
+        assert ranged_download.byte_ranges(0, 4) == []
@@ -0,0 +1,96 @@
+import threading
+import time
+
+import pytest
+
+from src.resource_boto_client import ResourceBotoClient
+
+from .helpers import mock_s3_client
+
+
+class TestResourceBotoClient:
+    def test_default_client_config(self, mocker):
+        boto3_client = mocker.patch('boto3.client', return_value=mock_s3_client(mocker))
+        client = ResourceBotoClient({'params': {'concurrency': 32}})
+        client.client
+        config = boto3_client.call_args[1]['config']
+        assert config.max_pool_connections == 32
+        assert client.transfer_config is None
+
+    def test_default_pool_covers_listing_concurrency(self, mocker):
+        boto3_client = mocker.patch('boto3.client', return_value=mock_s3_client(mocker))
+        client = ResourceBotoClient({'source': {'listing': {'concurrency': 32}},
+                                     'params': {'concurrency': 4}})
+        client.client
+        assert boto3_client.call_args[1]['config'].max_pool_connections == 32
+
+    def test_client_built_once_under_concurrent_first_use(self, mocker):
+        def slow_client(**kwargs):
+            time.sleep(0.05)
+            return mock_s3_client(mocker)
+
+        boto3_client = mocker.patch('boto3.client', side_effect=slow_client)
+        client = ResourceBotoClient({})
+        clients = []
+        threads = [threading.Thread(target=lambda: clients.append(client.client)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert boto3_client.call_count == 1
+        assert all(built is clients[0] for built in clients)
+
+    def test_tuned_client_and_transfer_config(self, mocker):
+        boto3_client = mocker.patch('boto3.client', return_value=mock_s3_client(mocker))
+        client = ResourceBotoClient({
+            'source': {
+                'service': {
+                    'max_pool_connections': 64,
+                    'tcp_keepalive': True,
+                    'retry_mode': 'adaptive',
+                    'max_attempts': 8
+                },
+                'transfer': {
+                    'multipart_threshold': 64 * 1024 * 1024,
+                    'multipart_chunksize': 16 * 1024 * 1024,
+                    'max_concurrency': 4
+                }
+            }
+        })
+        client.client
+        config = boto3_client.call_args[1]['config']
+        assert config.max_pool_connections == 64
+        assert config.tcp_keepalive is True
+        assert config.retries == {'mode': 'adaptive', 'max_attempts': 8}
+        assert client.transfer_config.multipart_threshold == 64 * 1024 * 1024
+        assert client.transfer_config.multipart_chunksize == 16 * 1024 * 1024
+        assert client.transfer_config.max_request_concurrency == 4
+
+    def test_transfer_config_passed_to_transfers(self, mocker, tmp_path):
+        mock_client = mock_s3_client(mocker)
+        mocker.patch('boto3.client', return_value=mock_client)
+        client = ResourceBotoClient({'source': {'transfer': {'multipart_threshold': 1024}}})
+        client.download_file(key='file.txt', destination=tmp_path / 'file.txt')
+        client.upload_file(source=str(tmp_path / 'file.txt'), key='file.txt')
+        assert mock_client.download_file.call_args[1]['Config'] is client.transfer_config
+        assert mock_client.upload_file.call_args[1]['Config'] is client.transfer_config
+
+    @pytest.mark.parametrize('source', [
+        {'service': {'retry_mode': 'eventually'}},
+        {'service': {'tcp_keepalive': 'yes'}},
+        {'service': {'max_pool_connections': -1}},
+        {'transfer': {'multipart_chunksize': '8MB'}},
+        {'transfer': {'max_concurrency': 0}},
+        {'service': {'max_pool_connections': 0}},
+        {'listing': {'concurrency': 0}},
+        {'cache': {'ttl': 0}},
+        {'filters': {'keep': 0}},
+    ])
+    def test_invalid_tuning_rejected(self, source):
+        with pytest.raises(ValueError):
+            ResourceBotoClient({'source': source})
+
+    @pytest.mark.parametrize('params', [{'concurrency': 0}, {'range_size': 0}])
+    def test_zero_params_rejected(self, params):
+        with pytest.raises(ValueError):
+            ResourceBotoClient({'params': params})
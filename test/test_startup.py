@@ -0,0 +1,31 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+def run_entry_point(module, input, *args):
+    code = ('import runpy, sys\n'
+            f'sys.argv = [{module!r}, *{list(args)!r}]\n'
+            f'runpy.run_module({module!r}, run_name="__main__")\n'
+            'sys.stderr.write("boto3 imported: %s" % ("boto3" in sys.modules))\n')
+    return subprocess.run([sys.executable, '-c', code],
+                          input=json.dumps(input).encode(),
+                          cwd=REPO_DIR,
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE,
+                          check=True)
+
+
+class TestStartup:
+    def test_check_without_regexp_skips_boto3(self):
+        result = run_entry_point('src.action_check', {})
+        assert json.loads(result.stdout) == []
+        assert result.stderr.decode().endswith('boto3 imported: False')
+
+    def test_in_without_mode_skips_boto3(self, tmp_path):
+        result = run_entry_point('src.action_in', {'params': {}}, str(tmp_path))
+        assert json.loads(result.stdout) == {}
+        assert result.stderr.decode().endswith('boto3 imported: False')
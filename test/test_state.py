@@ -0,0 +1,19 @@
+from src import state
+
+
+class TestState:
+    def test_state_round_trip(self, tmp_path):
+        path = state.state_path(tmp_path, 'high-water-mark', 'bucket', 'prefix/')
+        state.write_state(path, {'start_after': 'prefix/b'})
+        assert state.read_state(path) == {'start_after': 'prefix/b'}
+        assert list(tmp_path.iterdir()) == [path]
+
+    def test_state_path_depends_on_identity(self, tmp_path):
+        assert (state.state_path(tmp_path, 'kind', 'bucket', 'a/')
+                != state.state_path(tmp_path, 'kind', 'bucket', 'b/'))
+
+    def test_read_missing_or_corrupt_state(self, tmp_path):
+        assert state.read_state(tmp_path / 'missing.json') == {}
+        corrupt = tmp_path / 'corrupt.json'
+        corrupt.write_text('{"start_aft')
+        assert state.read_state(corrupt) == {}
@@ -0,0 +1,22 @@
+from src import sync_manifest
+from src.utils import ObjectRecord
+
+
+class TestSyncManifest:
+    def test_scan_files_walks_tree_once(self, tmp_path):
+        (tmp_path / 'book' / 'm1').mkdir(parents=True)
+        (tmp_path / 'book' / 'm1' / 'index.cnxml').write_text('')
+        (tmp_path / 'file.txt').write_text('')
+        assert sync_manifest.scan_files(tmp_path) == {'book/m1/index.cnxml', 'file.txt'}
+
+    def test_scan_files_missing_root(self, tmp_path):
+        assert sync_manifest.scan_files(tmp_path / 'missing') == set()
+
+    def test_manifest_round_trip(self, tmp_path):
+        record = ObjectRecord('file.txt', mtime=1574374217.13, size=88,
+                              etag='"8acbe8269ef193c7d541e56c8ca1e6d0"')
+        path = tmp_path / 'manifest.json'
+        assert sync_manifest.load_manifest(path) == {}
+        sync_manifest.save_manifest(path, {'file.txt': sync_manifest.manifest_entry(record)})
+        loaded = sync_manifest.load_manifest(path)
+        assert loaded['file.txt'] == sync_manifest.manifest_entry(record)
@@ -1,3 +1,5 @@
+from datetime import datetime, timezone
+
 import pytest
 
 from src import utils
@@ -60,3 +62,132 @@ class TestUtils:
         semver = '0.F.3'
         with pytest.raises(ValueError):
             utils.parse_semver_array_from_string(semver)
+
+    def test_version_index_parses_each_key_once(self, mocker):
+        response_objects = [
+            {'Key': 'book/1.9.0/book.zip', 'LastModified': '2019-11-21T20:05:51.000Z'},
+            {'Key': 'book/1.10.0/book.zip', 'LastModified': '2019-11-20T20:05:51.000Z'},
+            {'Key': 'unrelated.txt', 'LastModified': '2019-11-22T20:05:51.000Z'}
+        ]
+        regexp = r'book/(\d+\.\d+\.\d+)/book\.zip'
+        parse_spy = mocker.spy(utils, 'parse_semver_array_from_string')
+        index = utils.VersionIndex(regexp, response_objects)
+        assert parse_spy.call_count == 2
+        assert [record.key for record in index.sorted_records()] == [
+            'book/1.9.0/book.zip', 'book/1.10.0/book.zip']
+        latest = utils.VersionIndex(regexp, response_objects, keep=1).sorted_records()
+        assert [(record.key, record.version) for record in latest] == [('book/1.10.0/book.zip', (1, 10, 0))]
+        not_less_than = utils.VersionIndex(regexp, response_objects, threshold_semver=[1, 10])
+        assert [record.key for record in not_less_than.sorted_records()] == ['book/1.10.0/book.zip']
+
+    def test_version_index_latest_ties_broken_by_last_modified(self):
+        response_objects = [
+            {'Key': 'file.text', 'LastModified': '2019-11-22T06:04:34.232Z'},
+            {'Key': 'file.txt', 'LastModified': '2019-11-22T06:03:32.328Z'}
+        ]
+        index = utils.VersionIndex(r'file.te?xt', response_objects, keep=1)
+        assert [record.key for record in index.sorted_records()] == ['file.text']
+
+    def test_version_index_keeps_newest_in_version_order(self):
+        response_objects = [
+            {'Key': f'book/{major}.{minor}.0/book.zip', 'LastModified': '2019-11-21T20:05:51.000Z'}
+            for major in [2, 1, 10] for minor in [9, 10, 0]
+        ]
+        index = utils.VersionIndex(r'book/(\d+\.\d+\.\d+)/book\.zip', response_objects, keep=4)
+        assert len(index.records) == 4
+        assert [record.version for record in index.sorted_records()] == [
+            (2, 10, 0), (10, 0, 0), (10, 9, 0), (10, 10, 0)]
+
+    def test_object_record_keeps_only_needed_fields(self):
+        response_object = {
+            'Key': 'file.txt',
+            'LastModified': '2019-11-21T22:10:17.130Z',
+            'ETag': '"8acbe8269ef193c7d541e56c8ca1e6d0"',
+            'Size': 88,
+            'StorageClass': 'STANDARD',
+            'Owner': {'DisplayName': '', 'ID': ''}
+        }
+        record = utils.ObjectRecord.from_response_object(response_object, (1, 0))
+        assert (record.key, record.version, record.size, record.etag) == (
+            'file.txt', (1, 0), 88, '"8acbe8269ef193c7d541e56c8ca1e6d0"')
+        assert record.mtime == utils.last_modified_timestamp('2019-11-21T22:10:17.130Z')
+        assert not hasattr(record, '__dict__')
+
+    def test_parse_positive_int(self):
+        assert utils.parse_positive_int('4', 'params.concurrency') == 4
+        assert utils.parse_positive_int(16, 'params.concurrency') == 16
+
+    def test_parse_positive_int_invalid(self):
+        for value in [0, '-1', 'many', 1.5, True]:
+            with pytest.raises(ValueError):
+                utils.parse_positive_int(value, 'params.concurrency')
+
+    def test_positive_int_option(self):
+        input = {'params': {'concurrency': 0, 'range_size': '8'}}
+        assert utils.positive_int_option(input, 'params', 'range_size') == 8
+        assert utils.positive_int_option(input, 'params', 'keep', default=3) == 3
+        with pytest.raises(ValueError, match='params.concurrency'):
+            utils.positive_int_option(input, 'params', 'concurrency', default=10)
+
+    def test_map_concurrently_reports_each_failure(self):
+        def fail_on_odd(number):
+            if number % 2:
+                raise OSError(number)
+            return number
+
+        results = {number: (result, error)
+                   for number, result, error in utils.map_concurrently(fail_on_odd, iter(range(20)), 3)}
+        assert sorted(results) == list(range(20))
+        assert all(results[number] == (number, None) for number in range(0, 20, 2))
+        assert all(results[number][0] is None and isinstance(results[number][1], OSError)
+                   for number in range(1, 20, 2))
+
+    def test_last_modified_timestamp(self):
+        parsed = datetime(2019, 11, 21, 20, 5, 51, tzinfo=timezone.utc)
+        assert utils.last_modified_timestamp('2019-11-21T20:05:51.000Z') == parsed.timestamp()
+        assert utils.last_modified_timestamp('2019-11-21T20:05:51Z') == parsed.timestamp()
+        assert utils.last_modified_timestamp(parsed) == parsed.timestamp()
+        assert utils.last_modified_timestamp(None) == 0.0
+
+    def test_regexp_literal_prefix(self):
+        assert (utils.regexp_literal_prefix(r'builds/college-physics/(\d+\.\d+\.\d+)/book\.zip')
+                == 'builds/college-physics/')
+        assert utils.regexp_literal_prefix(r'(book)/m(?P<version>\d+)/.*') == 'book/m'
+        assert utils.regexp_literal_prefix(r'^file\.txt') == 'file.txt'
+        assert utils.regexp_literal_prefix(r'file.te?xt') == 'file'
+
+    def test_regexp_literal_prefix_none_when_unsafe(self):
+        assert utils.regexp_literal_prefix(r'(?i)book/.*') == ''
+        assert utils.regexp_literal_prefix(r'(?i:Builds)/x(\d+)') == ''
+        assert utils.regexp_literal_prefix(r'books/(?i:Builds)/x(\d+)') == 'books/'
+        assert utils.regexp_literal_prefix(r'book|other') == ''
+        assert utils.regexp_literal_prefix(r'(ab)*c') == ''
+
+    def test_regexp_exact_key(self):
+        assert utils.regexp_exact_key(r'file\.txt$') == 'file.txt'
+        assert utils.regexp_exact_key(r'^books/physics\.pdf\Z') == 'books/physics.pdf'
+
+    def test_regexp_exact_key_none_when_not_exact(self):
+        assert utils.regexp_exact_key('file.txt') is None
+        assert utils.regexp_exact_key(r'file\.txt') is None
+        assert utils.regexp_exact_key(r'(file)\.txt$') is None
+        assert utils.regexp_exact_key(r'(?i)file\.txt$') is None
+
+    def test_merge_concurrently_yields_every_item(self):
+        iterables = [range(start, start + 100) for start in range(0, 1000, 100)]
+        merged = list(utils.merge_concurrently(iterables, 4, max_pending=3))
+        assert sorted(merged) == list(range(1000))
+
+    def test_merge_concurrently_reraises(self):
+        def failing():
+            yield 1
+            raise OSError('listing failed')
+
+        with pytest.raises(OSError, match='listing failed'):
+            list(utils.merge_concurrently([range(10), failing()], 2))
+
+    def test_glob_literal_prefix(self):
+        assert utils.glob_literal_prefix('book/**/*.html') == 'book/'
+        assert utils.glob_literal_prefix('book/chapters/*.html') == 'book/chapters/'
+        assert utils.glob_literal_prefix('**/*.txt') == ''
+        assert utils.glob_literal_prefix('book/ch[0-9]/index.html') == 'book/'